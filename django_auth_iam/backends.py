@@ -11,17 +11,43 @@ framework.
 
 """
 
+import threading
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from boto.exception import BotoServerError
 from django.conf import settings
-from django.contrib.auth.models import User
 from django.contrib.auth.backends import ModelBackend
-from django.utils.importlib import import_module
-from django.core.exceptions import ImproperlyConfigured
+
+from .cache import get_credential_cache
+from .credentials import LazyCredentials
+from .instrumentation import phase
+from .localusers import get_local_user_resolver
+from .permissions import get_permission_cache
+from .ratelimit import get_client_ip, get_rate_limiter
+from .resilience import NETWORK_ERRORS, deadline
+from .sts import get_sts_provider
+from .utils import KeyCipher, import_class
+from .verification import OVERLOADED
 
 import logging
 logger = logging.getLogger('django_auth_iam')
 
 
 IAM_USER_CLASS = getattr(settings, 'IAM_USER_CLASS', 'django_auth_iam.models.User')
+IAM_ASYNC_POOL_SIZE = getattr(settings, 'IAM_ASYNC_POOL_SIZE', 10)
+IAM_AUTHENTICATE_DEADLINE = getattr(settings, 'IAM_AUTHENTICATE_DEADLINE', 10)
+
+
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+def _get_async_pool():
+    global _async_pool
+    with _async_pool_lock:
+        if _async_pool is None:
+            _async_pool = ThreadPool(IAM_ASYNC_POOL_SIZE)
+        return _async_pool
 
 
 class AmazonIAMBackend(ModelBackend):
@@ -37,30 +63,157 @@ class AmazonIAMBackend(ModelBackend):
         self.user_class = self._load_user_class()
 
     def _load_user_class(self):
-        module, sep, attr = IAM_USER_CLASS.rpartition('.')
-        try:
-            mod = import_module(module)
-        except ImportError, e:
-            raise ImproperlyConfigured('Error importing user class module '
-                                       '{0}: "{1}"'.format(module, e))
-        except ValueError, e:
-            raise ImproperlyConfigured('Error importing user class module. '
-                                       'Is IAM_USER_CLASS a string?')
-        try:
-            cls = getattr(mod, attr)
-        except AttributeError:
-            raise ImproperlyConfigured('Module "{0}" does not define a '
-                                       '"{1}" user class'.format(module, attr))
-        return cls
-
-    def authenticate(self, username=None, password=None):
-        iamuser = self.user_class.get_by_username(username)
-        if iamuser is None or iamuser.password != password:
-            logger.info('Authentication FAILED for user `{0}`'.format(username))
-            return None
-        secret_key = iamuser.get_secret_key(password)
-        user, created = User.objects.get_or_create(username=username)
-        user.aws_credentials = (iamuser.access_key, secret_key)
+        return import_class(IAM_USER_CLASS, 'IAM_USER_CLASS')
+
+    def authenticate(self, username=None, password=None, request=None):
+        """Returns the local user for ``username`` if ``password`` is
+        correct, otherwise ``None``.
+
+        Logins are rejected without looking up the user once the failed
+        logins of ``username``, or of the client of ``request`` if it is
+        given, exceed the limits of the
+        :class:`~django_auth_iam.ratelimit.LoginRateLimiter`.
+
+        """
+        limiter = get_rate_limiter()
+        ip = get_client_ip(request)
+        if limiter is not None:
+            scope = limiter.check(username, ip)
+            if scope is not None:
+                logger.warning('Authentication REJECTED for user `{0}`: too '
+                               'many failed logins per {1}'
+                               .format(username, scope))
+                return None
+        cache = get_credential_cache()
+        with phase('cache'):
+            cached = cache.get(username, password)
+        if cached is not None:
+            iamuser = cached
+        else:
+            with phase('lookup'):
+                iamuser = self._get_from_replica(username)
+                replicated = iamuser is not None
+                if not replicated:
+                    with deadline(IAM_AUTHENTICATE_DEADLINE):
+                        iamuser = self.user_class.get_by_username(username)
+            verified = False
+            if iamuser is not None:
+                with phase('verify'):
+                    verified = iamuser.password.verify(password, username)
+            if verified is False and replicated:
+                # The password may have changed since the replica was
+                # synced. Only verify again if the hash has changed.
+                current = self._get_current(username)
+                if (current is not None and
+                        str(current.password) != str(iamuser.password)):
+                    iamuser = current
+                    with phase('verify'):
+                        verified = iamuser.password.verify(password,
+                                                           username)
+            if verified is OVERLOADED:
+                logger.warning('Authentication REJECTED for user `{0}`: '
+                               'password verification is overloaded'
+                               .format(username))
+                return None
+            if not verified:
+                logger.info('Authentication FAILED for user `{0}`'
+                            .format(username))
+                if limiter is not None:
+                    limiter.failed(username, ip)
+                return None
+            if iamuser.password.needs_rehash():
+                _get_async_pool().apply_async(self._rehash,
+                                              (iamuser, password))
+            if hasattr(iamuser, 'snapshot'):
+                iamuser = iamuser.snapshot()
+            cache.set(username, password, iamuser)
+        with phase('local_user'):
+            user = get_local_user_resolver().get_user(username)
+        # The credentials keep the derived key, not the password.
+        keys = partial(self._load_credentials, iamuser, KeyCipher(password))
+        provider = get_sts_provider()
+        if provider is not None:
+            user.aws_credentials = LazyCredentials(
+                partial(provider.get, username, keys))
+        else:
+            user.aws_credentials = LazyCredentials(keys)
         user.iam_user = iamuser
         logger.info('Authentication SUCCEEDED for user `{0}`'.format(username))
         return user
+
+    def _get_from_replica(self, username):
+        get_from_replica = getattr(self.user_class, 'get_from_replica', None)
+        if get_from_replica is None:
+            return None
+        try:
+            return get_from_replica(username)
+        except Exception:
+            logger.exception('Reading user `{0}` from the local replica '
+                             'FAILED'.format(username))
+            return None
+
+    def _get_current(self, username):
+        try:
+            with phase('lookup'), deadline(IAM_AUTHENTICATE_DEADLINE):
+                return self.user_class.get_by_username(username)
+        except (BotoServerError,) + NETWORK_ERRORS as e:
+            logger.warning('Looking up user `{0}` in SimpleDB FAILED: {1}'
+                           .format(username, e))
+            return None
+
+    @staticmethod
+    def _load_credentials(iamuser, cipher):
+        with phase('decrypt'):
+            return iamuser.access_key, iamuser.get_secret_key(cipher)
+
+    def _rehash(self, iamuser, password):
+        try:
+            rehashed = self.user_class.rehash_password(iamuser, password)
+        except Exception:
+            logger.exception('Rehashing the password of user `{0}` FAILED'
+                             .format(iamuser.username))
+        else:
+            if rehashed:
+                logger.info('Rehashed the password of user `{0}`'
+                            .format(iamuser.username))
+            else:
+                logger.info('Not rehashing the password of user `{0}`: it '
+                            'has changed since the login'
+                            .format(iamuser.username))
+
+    def get_all_permissions(self, user_obj):
+        """Returns the permissions of ``user_obj`` from the shared
+        :class:`~django_auth_iam.permissions.PermissionCache`, computing
+        them with :class:`~django.contrib.auth.backends.ModelBackend` on
+        a miss.
+
+        """
+        if user_obj.is_anonymous():
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            cache = get_permission_cache()
+            version, perms = cache.get(user_obj.pk)
+            if perms is None:
+                perms = super(AmazonIAMBackend, self).get_all_permissions(
+                    user_obj)
+                cache.set(user_obj.pk, version, perms)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+    def aauthenticate(self, username=None, password=None, callback=None,
+                      request=None):
+        """Authenticate without blocking the calling thread.
+
+        The SimpleDB lookup, the password verification and the database
+        lookup are run by a pool of ``IAM_ASYNC_POOL_SIZE`` threads.
+        Returns a :class:`multiprocessing.pool.AsyncResult`; its
+        ``get()`` method returns the same value as :meth:`authenticate`.
+        If ``callback`` is given it is called with the result when the
+        authentication completes.
+
+        """
+        kwargs = {'username': username, 'password': password}
+        if request is not None:
+            kwargs['request'] = request
+        return _get_async_pool().apply_async(self.authenticate, (), kwargs,
+                                             callback)
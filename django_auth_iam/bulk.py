@@ -0,0 +1,121 @@
+"""
+django_auth_iam.bulk
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides helpers for provisioning many users and groups
+at once.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+
+SDB_BATCH_SIZE = 25
+"""Maximum number of items in a single SimpleDB batch request."""
+
+
+class BulkResult(object):
+    """Outcome of a bulk operation for a single user or group.
+
+    :attr:`status` is one of ``'created'``, ``'exists'``, ``'deleted'``,
+    ``'missing'`` or ``'failed'``. If the operation failed,
+    :attr:`error` holds the exception that caused it. :attr:`steps`
+    maps each step of a bulk deletion to its outcome, ``'deleted'``,
+    ``'missing'`` or ``'failed'``, in the order the steps were taken.
+
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.status = None
+        self.obj = None
+        self.error = None
+        self.steps = OrderedDict()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def fail(self, error):
+        self.status = 'failed'
+        self.error = error
+
+    def __repr__(self):
+        return '<BulkResult {0}: {1}>'.format(self.name, self.status)
+
+
+class BulkReport(object):
+    """Per-item report returned by the bulk operations.
+
+    Iterating over the report yields a :class:`BulkResult` for each
+    item in the order they were given.
+
+    """
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, name):
+        for result in self.results:
+            if result.name == name:
+                return result
+        raise KeyError(name)
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+
+def run_concurrently(func, items, concurrency):
+    """Call ``func`` for each of ``items`` using at most ``concurrency``
+    threads. Returns the return values in the order of ``items``.
+
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    pool = ThreadPool(min(concurrency, len(items)))
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def chunks(items, size=SDB_BATCH_SIZE):
+    """Split ``items`` into lists of at most ``size`` elements."""
+    items = list(items)
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def item_attributes(obj):
+    """Returns the SimpleDB attributes for the model instance ``obj``
+    encoded the same way :meth:`boto.sdb.db.model.Model.put` does.
+
+    """
+    manager = obj._manager
+    attrs = {'__type__': obj.__class__.__name__,
+             '__module__': obj.__class__.__module__,
+             '__lineage__': obj.get_lineage()}
+    for prop in obj.properties(hidden=False):
+        value = prop.get_value_for_datastore(obj)
+        if value is not None:
+            value = manager.encode_value(prop, value)
+        if value is not None and value != []:
+            attrs[prop.name] = value
+    return attrs
@@ -0,0 +1,276 @@
+"""
+django_auth_iam.cache
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the caches used on the authentication path.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+
+from .utils import import_class
+
+
+IAM_CREDENTIAL_CACHE = getattr(settings, 'IAM_CREDENTIAL_CACHE',
+                               'django_auth_iam.cache.DummyCredentialCache')
+IAM_CREDENTIAL_CACHE_TTL = getattr(settings, 'IAM_CREDENTIAL_CACHE_TTL', 300)
+IAM_CREDENTIAL_CACHE_SIZE = getattr(settings, 'IAM_CREDENTIAL_CACHE_SIZE', 1000)
+IAM_NAME_INDEX_SIZE = getattr(settings, 'IAM_NAME_INDEX_SIZE', 10000)
+IAM_NAME_INDEX_TTL = getattr(settings, 'IAM_NAME_INDEX_TTL', 3600)
+IAM_NAME_INDEX_NEGATIVE_TTL = getattr(settings, 'IAM_NAME_INDEX_NEGATIVE_TTL', 30)
+IAM_NAME_INDEX_USE_DJANGO_CACHE = getattr(settings,
+                                          'IAM_NAME_INDEX_USE_DJANGO_CACHE',
+                                          False)
+
+NOT_FOUND = object()
+"""Returned by :meth:`NameIndex.get` for names known not to exist."""
+
+
+class LRUCache(object):
+    """A thread-safe mapping bounded in size and, optionally, in the age
+    of its entries.
+
+    When the cache is full the least recently used entry is discarded.
+    Entries older than ``ttl`` seconds are treated as missing.
+
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires < time.time():
+                return default
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BaseCredentialCache(object):
+    """Base class for caches of verified credentials.
+
+    Entries are keyed on the username and a keyed digest of the
+    password, so the plaintext password is never kept. Subclasses
+    implement :meth:`_get`, :meth:`_set` and :meth:`invalidate`.
+
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(username, password):
+        """Returns a keyed digest of ``username`` and ``password``."""
+        if isinstance(username, unicode):
+            username = username.encode('utf8')
+        if isinstance(password, unicode):
+            password = password.encode('utf8')
+        return hmac.new(settings.SECRET_KEY, username + '\0' + password,
+                        hashlib.sha256).hexdigest()
+
+    def get(self, username, password):
+        """Returns the entry stored for the credentials or ``None``."""
+        entry = None
+        if username and password:
+            entry = self._get(username, self.digest(username, password))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, username, password, entry):
+        """Store ``entry`` for the verified credentials."""
+        if username and password:
+            self._set(username, self.digest(username, password), entry)
+
+    def invalidate(self, username):
+        """Forget any entry stored for ``username``."""
+        raise NotImplementedError
+
+    def stats(self):
+        """Returns a dictionary with the hit and miss counters."""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, username, digest):
+        raise NotImplementedError
+
+    def _set(self, username, digest, entry):
+        raise NotImplementedError
+
+
+class LocalCredentialCache(BaseCredentialCache):
+    """In-process credential cache bounded by ``IAM_CREDENTIAL_CACHE_SIZE``
+    and ``IAM_CREDENTIAL_CACHE_TTL``.
+
+    Only the most recently verified password is kept for each user.
+    Entries are only invalidated in the process that changes or deletes
+    the user; other processes keep accepting the old password for up to
+    ``IAM_CREDENTIAL_CACHE_TTL`` seconds.
+
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        super(LocalCredentialCache, self).__init__()
+        if max_size is None:
+            max_size = IAM_CREDENTIAL_CACHE_SIZE
+        if ttl is None:
+            ttl = IAM_CREDENTIAL_CACHE_TTL
+        self._cache = LRUCache(max_size, ttl)
+
+    def _get(self, username, digest):
+        cached = self._cache.get(username)
+        if cached is None or cached[0] != digest:
+            return None
+        return cached[1]
+
+    def _set(self, username, digest, entry):
+        self._cache.set(username, (digest, entry))
+
+    def invalidate(self, username):
+        self._cache.delete(username)
+
+
+class DummyCredentialCache(BaseCredentialCache):
+    """Credential cache that never stores anything."""
+
+    def _get(self, username, digest):
+        return None
+
+    def _set(self, username, digest, entry):
+        pass
+
+    def invalidate(self, username):
+        pass
+
+
+_credential_cache = None
+
+def get_credential_cache():
+    """Returns the credential cache configured by ``IAM_CREDENTIAL_CACHE``."""
+    global _credential_cache
+    if _credential_cache is None:
+        cls = import_class(IAM_CREDENTIAL_CACHE, 'IAM_CREDENTIAL_CACHE')
+        _credential_cache = cls()
+    return _credential_cache
+
+
+class NameIndex(object):
+    """Read-through index mapping names to SimpleDB item ids.
+
+    Lookups are served from an in-process LRU cache and, if
+    ``IAM_NAME_INDEX_USE_DJANGO_CACHE`` is set, from Django's cache
+    framework so that all processes share the index. Names that are
+    known not to exist are cached for ``IAM_NAME_INDEX_NEGATIVE_TTL``
+    seconds.
+
+    """
+
+    def __init__(self, namespace, max_size=None, ttl=None, negative_ttl=None,
+                 use_django_cache=None):
+        if max_size is None:
+            max_size = IAM_NAME_INDEX_SIZE
+        if ttl is None:
+            ttl = IAM_NAME_INDEX_TTL
+        if negative_ttl is None:
+            negative_ttl = IAM_NAME_INDEX_NEGATIVE_TTL
+        if use_django_cache is None:
+            use_django_cache = IAM_NAME_INDEX_USE_DJANGO_CACHE
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.use_django_cache = use_django_cache
+        self._ids = LRUCache(max_size, ttl)
+        self._missing = LRUCache(max_size, negative_ttl)
+
+    def _key(self, name):
+        if isinstance(name, unicode):
+            name = name.encode('utf8')
+        return 'django_auth_iam:index:{0}:{1}'.format(
+            self.namespace, hashlib.md5(name).hexdigest())
+
+    def get(self, name):
+        """Returns the item id for ``name``, :data:`NOT_FOUND` if the
+        name is known not to exist or ``None`` if the name is not in the
+        index.
+
+        """
+        item_id = self._ids.get(name)
+        if item_id is not None:
+            return item_id
+        if self._missing.get(name) is not None:
+            return NOT_FOUND
+        if self.use_django_cache:
+            item_id = django_cache.get(self._key(name))
+            if item_id == '':
+                self._missing.set(name, True)
+                return NOT_FOUND
+            if item_id is not None:
+                self._ids.set(name, item_id)
+                return item_id
+        return None
+
+    def set(self, name, item_id):
+        """Record that ``name`` is stored in the item ``item_id``."""
+        self._missing.delete(name)
+        self._ids.set(name, item_id)
+        if self.use_django_cache:
+            django_cache.set(self._key(name), item_id, self.ttl)
+
+    def set_missing(self, name):
+        """Record that no item exists for ``name``."""
+        self._ids.delete(name)
+        self._missing.set(name, True)
+        if self.use_django_cache:
+            django_cache.set(self._key(name), '', self.negative_ttl)
+
+    def invalidate(self, name):
+        """Remove ``name`` from the index."""
+        self._ids.delete(name)
+        self._missing.delete(name)
+        if self.use_django_cache:
+            django_cache.delete(self._key(name))
+
+    def clear(self):
+        """Remove all names from the in-process index."""
+        self._ids.clear()
+        self._missing.clear()
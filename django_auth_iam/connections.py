@@ -0,0 +1,220 @@
+"""
+django_auth_iam.connections
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides pooled connections to IAM and SimpleDB.
+
+Creating a :mod:`boto` connection is cheap, but every new connection
+has to open a new HTTPS connection to AWS. The pools in this module
+keep one connection per thread alive and hand it out again, so the
+TLS handshake is only paid once per thread.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import thread
+import threading
+import time
+from collections import OrderedDict
+
+import boto
+# boto.sdb.db.manager.sdbmanager and boto.sdb.db.model import each
+# other; importing the manager first fails.
+from boto.sdb.db.model import ModelMeta
+from boto.sdb.db.manager.sdbmanager import SDBManager
+from django.conf import settings
+from django.utils.importlib import import_module
+
+from .resilience import ResilientConnection
+
+
+IAM_CONNECTION_FACTORY = getattr(settings, 'IAM_CONNECTION_FACTORY', 'boto')
+IAM_CONNECTION_POOL_SIZE = getattr(settings, 'IAM_CONNECTION_POOL_SIZE', 32)
+IAM_CONNECTION_IDLE_TIMEOUT = getattr(settings, 'IAM_CONNECTION_IDLE_TIMEOUT',
+                                      300)
+
+
+class ConnectionPool(object):
+    """Hands out one connection per thread.
+
+    At most ``max_size`` connections are kept; when more threads ask
+    for a connection the least recently used one is evicted.
+    Connections that have not been used for ``idle_timeout`` seconds
+    are evicted and replaced by a new connection on the next request.
+
+    """
+
+    def __init__(self, factory, max_size=None, idle_timeout=None):
+        if max_size is None:
+            max_size = IAM_CONNECTION_POOL_SIZE
+        if idle_timeout is None:
+            idle_timeout = IAM_CONNECTION_IDLE_TIMEOUT
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self._connections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the connection for the current thread."""
+        ident = thread.get_ident()
+        now = time.time()
+        with self._lock:
+            conn = None
+            entry = self._connections.pop(ident, None)
+            if entry is not None:
+                last_used, conn = entry
+                if self.idle_timeout and now - last_used > self.idle_timeout:
+                    self.evicted += 1
+                    conn = None
+                else:
+                    self.reused += 1
+            if conn is None:
+                conn = self.factory()
+                self.created += 1
+            self._connections[ident] = (now, conn)
+            while len(self._connections) > self.max_size:
+                self._connections.popitem(last=False)
+                self.evicted += 1
+        return conn
+
+    def clear(self):
+        """Drop all pooled connections."""
+        with self._lock:
+            self.evicted += len(self._connections)
+            self._connections.clear()
+
+    def stats(self):
+        """Returns a dictionary with the number of connections that
+        were created, reused and evicted and the current pool size.
+
+        """
+        return {'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+                'size': len(self._connections)}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(key, factory):
+    """Returns the pool registered under ``key``, creating it with
+    ``factory`` if it does not exist.
+
+    """
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(factory)
+        return pool
+
+
+def get_factory():
+    """Returns the module named by ``IAM_CONNECTION_FACTORY``. It must
+    provide ``connect_iam``, ``connect_sdb`` and ``connect_sts``
+    functions like those of :mod:`boto`.
+
+    """
+    return import_module(IAM_CONNECTION_FACTORY)
+
+
+def connect_iam(**kwargs):
+    """Returns a new, instrumented and resilient IAM connection."""
+    return ResilientConnection(get_factory().connect_iam(**kwargs), 'iam')
+
+
+def connect_sdb(**kwargs):
+    """Returns a new, instrumented and resilient SimpleDB connection."""
+    return ResilientConnection(get_factory().connect_sdb(**kwargs), 'sdb')
+
+
+def connect_sts(aws_access_key_id, aws_secret_access_key, **kwargs):
+    """Returns a new, instrumented and resilient STS connection signed
+    with the given keys. STS connections are made with the keys of a
+    user, so they are not pooled.
+
+    """
+    return ResilientConnection(
+        get_factory().connect_sts(aws_access_key_id=aws_access_key_id,
+                                  aws_secret_access_key=aws_secret_access_key,
+                                  **kwargs), 'sts')
+
+
+def get_iam():
+    """Returns a pooled IAM connection for the current thread."""
+    return get_pool('iam', connect_iam).get()
+
+
+def get_sdb():
+    """Returns a pooled SimpleDB connection for the current thread."""
+    return get_pool('sdb', connect_sdb).get()
+
+
+def clear():
+    """Drop the connections of all pools."""
+    with _pools_lock:
+        pools = _pools.values()
+    for pool in pools:
+        pool.clear()
+
+
+def stats():
+    """Returns the statistics of all pools, keyed on the pool name."""
+    with _pools_lock:
+        pools = _pools.items()
+    return dict((key, pool.stats()) for key, pool in pools)
+
+
+class PooledSDBManager(SDBManager):
+    """SimpleDB manager that takes its connections from a pool instead
+    of sharing a single connection between all threads.
+
+    """
+
+    def __init__(self, manager):
+        self.__dict__.update(manager.__dict__)
+        key = 'sdb:{0}@{1}'.format(self.db_user or 'default', self.db_host)
+        self._pool = get_pool(key, self._new_connection)
+
+    def _new_connection(self):
+        args = dict(aws_access_key_id=self.db_user,
+                    aws_secret_access_key=self.db_passwd,
+                    is_secure=self.enable_ssl)
+        try:
+            region = [x for x in boto.sdb.regions()
+                      if x.endpoint == self.db_host][0]
+            args['region'] = region
+        except IndexError:
+            pass
+        return connect_sdb(**args)
+
+    @property
+    def sdb(self):
+        return self._pool.get()
+
+    @property
+    def domain(self):
+        # The domain is assumed to exist, so no request is made here.
+        return self.sdb.lookup(self.db_name, validate=False)
+
+
+class PooledModelMeta(ModelMeta):
+    """Metaclass for models that should use a :class:`PooledSDBManager`.
+
+    The metaclass is inherited, so subclasses of the models use pooled
+    connections as well.
+
+    """
+
+    def __init__(cls, name, bases, dict):
+        super(PooledModelMeta, cls).__init__(name, bases, dict)
+        manager = cls.__dict__.get('_manager')
+        if (isinstance(manager, SDBManager) and
+                not isinstance(manager, PooledSDBManager)):
+            cls._manager = PooledSDBManager(manager)
@@ -0,0 +1,108 @@
+"""
+django_auth_iam.credentials
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the credentials object set on authenticated
+users.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+
+class LazyCredentials(object):
+    """AWS credentials that are decrypted the first time they are used.
+
+    ``loader`` is called without arguments on first access and must
+    return a tuple of strings, such as ``(access_key, secret_key)`` or
+    ``(access_key, secret_key, session_token)``. The object then
+    behaves like that tuple. If the loaded value has an ``expiration``
+    attribute, like
+    :class:`~django_auth_iam.sts.TemporaryCredentials`, it is kept in
+    :attr:`expiration`.
+
+    :meth:`clear` overwrites the decrypted values held by the object
+    and drops the loader, after which the credentials cannot be used
+    again. Copies of the values handed out before are not affected.
+
+    """
+
+    __slots__ = ('_loader', '_values', '_expiration')
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._values = None
+        self._expiration = None
+
+    def _load(self):
+        if self._values is None:
+            if self._loader is None:
+                raise ValueError('the credentials have been cleared')
+            loaded = self._loader()
+            self._expiration = getattr(loaded, 'expiration', None)
+            self._values = [bytearray(value.encode('utf8')
+                                      if isinstance(value, unicode) else value)
+                            for value in loaded]
+        return tuple(str(value) for value in self._values)
+
+    @property
+    def loaded(self):
+        """``True`` if the credentials have been decrypted."""
+        return self._values is not None
+
+    @property
+    def access_key(self):
+        return self._load()[0]
+
+    @property
+    def secret_key(self):
+        return self._load()[1]
+
+    @property
+    def session_token(self):
+        """The session token of temporary credentials or ``None``."""
+        values = self._load()
+        return values[2] if len(values) > 2 else None
+
+    @property
+    def expiration(self):
+        """The expiration of temporary credentials in seconds since the
+        epoch or ``None``.
+
+        """
+        self._load()
+        return self._expiration
+
+    def clear(self):
+        """Overwrite the decrypted values and forget how to load them."""
+        if self._values is not None:
+            for value in self._values:
+                value[:] = '\0' * len(value)
+        self._values = None
+        self._loader = None
+        self._expiration = None
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __nonzero__(self):
+        if self._values is None and self._loader is None:
+            return False
+        return bool(self._load())
+
+    def __eq__(self, other):
+        return self._load() == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__,
+                                  'loaded' if self.loaded else 'not loaded')
@@ -0,0 +1,679 @@
+"""
+django_auth_iam.fake
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides in-memory stand-ins for the IAM, SimpleDB and STS
+services.
+
+Set ``IAM_CONNECTION_FACTORY`` to ``'django_auth_iam.fake'`` to use
+them instead of AWS, for example in tests and benchmarks. All
+connections share the data in :data:`store`, and every call sleeps for
+``IAM_FAKE_LATENCY`` seconds to simulate the round-trip to AWS.
+
+Only the parts of the services used by this package are implemented.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import hashlib
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from boto.exception import BotoServerError
+from boto.resultset import ResultSet
+from boto.sdb.item import Item
+from boto.sts.credentials import AssumedRole, Credentials, FederationToken
+from django.conf import settings
+
+
+IAM_FAKE_LATENCY = getattr(settings, 'IAM_FAKE_LATENCY', 0)
+
+SELECT_LIMIT = 100
+"""Default number of items in a page of select results."""
+
+
+class FakeStore(object):
+    """The data of the fake services."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Remove all data and reset the call counters."""
+        with self.lock:
+            self.users = OrderedDict()
+            self.groups = OrderedDict()
+            self.domains = {}
+            self.calls = Counter()
+            self.failures = {}
+
+    def fail(self, operation, status=503, code='ServiceUnavailable',
+             times=1):
+        """Make the next ``times`` calls of ``operation``, such as
+        ``'iam.create_user'``, fail with ``status`` and the error
+        ``code``.
+
+        """
+        with self.lock:
+            self.failures[operation] = [status, code, times]
+
+    def domain(self, name):
+        # Domain names are compared as they appear in select queries.
+        with self.lock:
+            return self.domains.setdefault(str(name), OrderedDict())
+
+
+store = FakeStore()
+"""The :class:`FakeStore` shared by all fake connections."""
+
+
+def _error(status, reason, code):
+    body = ('<ErrorResponse><Error><Code>{0}</Code></Error></ErrorResponse>'
+            .format(code))
+    return BotoServerError(status, reason, body)
+
+
+class FakeConnection(object):
+
+    def __init__(self, latency=None, **kwargs):
+        if latency is None:
+            latency = IAM_FAKE_LATENCY
+        self.latency = latency
+
+    def _call(self, operation):
+        if self.latency:
+            time.sleep(self.latency)
+        with store.lock:
+            store.calls[operation] += 1
+            failure = store.failures.get(operation)
+            if failure is not None:
+                failure[2] -= 1
+                if failure[2] <= 0:
+                    del store.failures[operation]
+                raise _error(failure[0], 'Injected', failure[1])
+
+
+class FakeIAMConnection(FakeConnection):
+    """In-memory stand-in for :class:`boto.iam.connection.IAMConnection`."""
+
+    def _user(self, user_name):
+        try:
+            return store.users[user_name]
+        except KeyError:
+            raise _error(404, 'Not Found', 'NoSuchEntity')
+
+    def _group(self, group_name):
+        try:
+            return store.groups[group_name]
+        except KeyError:
+            raise _error(404, 'Not Found', 'NoSuchEntity')
+
+    @staticmethod
+    def _page(items, marker, max_items):
+        start = int(marker or 0)
+        end = start + (max_items or 100)
+        page = items[start:end]
+        truncated = end < len(items)
+        return page, truncated, str(end) if truncated else None
+
+    def create_user(self, user_name, path='/'):
+        self._call('iam.create_user')
+        with store.lock:
+            if user_name in store.users:
+                raise _error(409, 'Conflict', 'EntityAlreadyExists')
+            store.users[user_name] = {'keys': OrderedDict(), 'groups': set()}
+        return {'create_user_response': {'create_user_result': {
+            'user': {'user_name': user_name, 'path': path}}}}
+
+    def delete_user(self, user_name):
+        self._call('iam.delete_user')
+        with store.lock:
+            user = self._user(user_name)
+            if user['keys'] or user['groups']:
+                raise _error(409, 'Conflict', 'DeleteConflict')
+            del store.users[user_name]
+        return {}
+
+    def create_access_key(self, user_name=None):
+        self._call('iam.create_access_key')
+        with store.lock:
+            user = self._user(user_name)
+            if len(user['keys']) >= 2:
+                raise _error(409, 'Conflict', 'LimitExceeded')
+            key_id = 'AKIA' + uuid.uuid4().hex[:16].upper()
+            secret = hashlib.sha1(uuid.uuid4().bytes).digest().encode('base64')
+            secret = secret.strip()[:40]
+            user['keys'][key_id] = secret
+        return {'create_access_key_response': {'create_access_key_result': {
+            'access_key': {'access_key_id': key_id,
+                           'secret_access_key': secret,
+                           'user_name': user_name,
+                           'status': 'Active'}}}}
+
+    def get_all_access_keys(self, user_name, marker=None, max_items=None):
+        self._call('iam.get_all_access_keys')
+        with store.lock:
+            keys = list(self._user(user_name)['keys'])
+        return {'list_access_keys_response': {'list_access_keys_result': {
+            'access_key_metadata': [{'access_key_id': key,
+                                     'user_name': user_name}
+                                    for key in keys],
+            'is_truncated': 'false'}}}
+
+    def delete_access_key(self, access_key_id, user_name=None):
+        self._call('iam.delete_access_key')
+        with store.lock:
+            keys = self._user(user_name)['keys']
+            if access_key_id not in keys:
+                raise _error(404, 'Not Found', 'NoSuchEntity')
+            del keys[access_key_id]
+        return {}
+
+    def create_group(self, group_name, path='/'):
+        self._call('iam.create_group')
+        with store.lock:
+            if group_name in store.groups:
+                raise _error(409, 'Conflict', 'EntityAlreadyExists')
+            store.groups[group_name] = OrderedDict()
+        return {'create_group_response': {'create_group_result': {
+            'group': {'group_name': group_name, 'path': path}}}}
+
+    def delete_group(self, group_name):
+        self._call('iam.delete_group')
+        with store.lock:
+            if self._group(group_name):
+                raise _error(409, 'Conflict', 'DeleteConflict')
+            del store.groups[group_name]
+        return {}
+
+    def add_user_to_group(self, group_name, user_name):
+        self._call('iam.add_user_to_group')
+        with store.lock:
+            user = self._user(user_name)
+            self._group(group_name)[user_name] = True
+            user['groups'].add(group_name)
+        return {}
+
+    def remove_user_from_group(self, group_name, user_name):
+        self._call('iam.remove_user_from_group')
+        with store.lock:
+            user = self._user(user_name)
+            self._group(group_name).pop(user_name, None)
+            user['groups'].discard(group_name)
+        return {}
+
+    def get_all_groups(self, path_prefix='/', marker=None, max_items=None):
+        self._call('iam.get_all_groups')
+        with store.lock:
+            names = list(store.groups)
+        page, truncated, marker = self._page(names, marker, max_items)
+        result = {'groups': [{'group_name': name, 'path': '/'}
+                             for name in page],
+                  'is_truncated': 'true' if truncated else 'false'}
+        if marker:
+            result['marker'] = marker
+        return {'list_groups_response': {'list_groups_result': result}}
+
+    def get_group(self, group_name, marker=None, max_items=None):
+        self._call('iam.get_group')
+        with store.lock:
+            names = list(self._group(group_name))
+        page, truncated, marker = self._page(names, marker, max_items)
+        result = {'group': {'group_name': group_name, 'path': '/'},
+                  'users': [{'user_name': name} for name in page],
+                  'is_truncated': 'true' if truncated else 'false'}
+        if marker:
+            result['marker'] = marker
+        return {'get_group_response': {'get_group_result': result}}
+
+
+class FakeSTSConnection(FakeConnection):
+    """In-memory stand-in for :class:`boto.sts.STSConnection`.
+
+    Calls must be signed with an access key of a fake IAM user.
+    Temporary credentials are not checked anywhere; they only expire.
+
+    """
+
+    DEFAULT_DURATION = 3600
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None,
+                 latency=None, **kwargs):
+        super(FakeSTSConnection, self).__init__(latency)
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+
+    def _check_signature(self):
+        with store.lock:
+            for user in store.users.itervalues():
+                secret = user['keys'].get(self.aws_access_key_id)
+                if secret is not None and secret == self.aws_secret_access_key:
+                    return
+        raise _error(403, 'Forbidden', 'InvalidClientTokenId')
+
+    def _credentials(self, duration):
+        credentials = Credentials()
+        credentials.access_key = 'ASIA' + uuid.uuid4().hex[:16].upper()
+        credentials.secret_key = uuid.uuid4().hex + uuid.uuid4().hex[:8]
+        credentials.session_token = uuid.uuid4().hex * 4
+        expiration = time.time() + (duration or self.DEFAULT_DURATION)
+        credentials.expiration = time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                               time.gmtime(expiration))
+        return credentials
+
+    def get_federation_token(self, name, duration=None, policy=None):
+        self._call('sts.get_federation_token')
+        self._check_signature()
+        token = FederationToken()
+        token.credentials = self._credentials(duration)
+        token.federated_user_id = name
+        return token
+
+    def assume_role(self, role_arn, role_session_name, policy=None,
+                    duration_seconds=None, external_id=None):
+        self._call('sts.assume_role')
+        self._check_signature()
+        return AssumedRole(credentials=self._credentials(duration_seconds))
+
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<name>`(?:[^`]|``)*`) |
+    (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*") |
+    (?P<op>!=|<=|>=|=|<|>|\(|\)|,|\*) |
+    (?P<number>[0-9]+) |
+    (?P<word>[A-Za-z_][A-Za-z0-9_]*(?:\(\))?)
+    )""", re.VERBOSE)
+
+
+def _tokenize(query):
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = _TOKEN.match(query, pos)
+        if match is None:
+            raise _error(400, 'Bad Request', 'InvalidQueryExpression')
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name':
+            value = value[1:-1].replace('``', '`')
+        elif kind == 'string':
+            quote = value[0]
+            value = value[1:-1].replace(quote * 2, quote)
+        elif kind == 'word':
+            value = value.lower() if value.lower() != 'itemname()' else value
+        tokens.append((kind, value))
+        pos = match.end()
+    return tokens
+
+
+class _Query(object):
+    """Parser and evaluator for the subset of the SimpleDB select
+    syntax generated by :mod:`boto` and this package.
+
+    """
+
+    def __init__(self, query):
+        self.tokens = _tokenize(query)
+        self.pos = 0
+        self.columns = self.parse_columns()
+        self.expect('word', 'from')
+        self.domain = self.next()[1]
+        self.where = None
+        self.order_by = None
+        self.descending = False
+        self.limit = SELECT_LIMIT
+        if self.accept('word', 'where'):
+            self.where = self.parse_or()
+        if self.accept('word', 'order'):
+            self.expect('word', 'by')
+            self.order_by = self.next()[1]
+            if self.accept('word', 'desc'):
+                self.descending = True
+            else:
+                self.accept('word', 'asc')
+        if self.accept('word', 'limit'):
+            self.limit = int(self.next()[1])
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind, value=None):
+        if not self.accept(kind, value):
+            raise _error(400, 'Bad Request', 'InvalidQueryExpression')
+
+    def parse_columns(self):
+        self.expect('word', 'select')
+        if self.accept('op', '*'):
+            return None
+        if self.accept('word', 'count'):
+            self.expect('op', '(')
+            self.expect('op', '*')
+            self.expect('op', ')')
+            return 'count'
+        columns = [self.next()[1]]
+        while self.accept('op', ','):
+            columns.append(self.next()[1])
+        return columns
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('word', 'or'):
+            terms.append(self.parse_and())
+        return lambda name, attrs: any(t(name, attrs) for t in terms)
+
+    def parse_and(self):
+        factors = [self.parse_factor()]
+        while self.accept('word', 'and'):
+            factors.append(self.parse_factor())
+        return lambda name, attrs: all(f(name, attrs) for f in factors)
+
+    def parse_factor(self):
+        if self.accept('word', 'not'):
+            factor = self.parse_factor()
+            return lambda name, attrs: not factor(name, attrs)
+        if self.accept('op', '('):
+            expr = self.parse_or()
+            self.expect('op', ')')
+            return expr
+        kind, attr = self.next()
+
+        def values(name, attrs):
+            if attr == 'itemName()':
+                return [name]
+            return attrs.get(attr, [])
+
+        if self.accept('word', 'is'):
+            negate = self.accept('word', 'not')
+            self.expect('word', 'null')
+            return lambda name, attrs: bool(values(name, attrs)) == negate
+        if self.accept('word', 'in'):
+            self.expect('op', '(')
+            options = [self.next()[1]]
+            while self.accept('op', ','):
+                options.append(self.next()[1])
+            self.expect('op', ')')
+            return lambda name, attrs: any(v in options
+                                           for v in values(name, attrs))
+        negate = self.accept('word', 'not')
+        if self.accept('word', 'like'):
+            pattern = re.escape(self.next()[1]).replace('\\%', '.*')
+            regex = re.compile('^' + pattern + '$', re.DOTALL)
+            return lambda name, attrs: negate != any(
+                regex.match(v) for v in values(name, attrs))
+        op = self.next()[1]
+        value = self.next()[1]
+        compare = {'=': lambda a, b: a == b, '!=': lambda a, b: a != b,
+                   '<': lambda a, b: a < b, '>': lambda a, b: a > b,
+                   '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b}[op]
+        return lambda name, attrs: any(compare(v, value)
+                                       for v in values(name, attrs))
+
+    def matches(self, name, attrs):
+        return self.where is None or self.where(name, attrs)
+
+
+class FakeSDBConnection(FakeConnection):
+    """In-memory stand-in for :class:`boto.sdb.connection.SDBConnection`."""
+
+    converter = None
+
+    def __init__(self, latency=None, **kwargs):
+        super(FakeSDBConnection, self).__init__(latency)
+
+    def get_domain(self, domain_name, validate=True):
+        return FakeDomain(self, domain_name)
+
+    lookup = get_domain
+
+    def create_domain(self, domain_name):
+        self._call('sdb.create_domain')
+        store.domain(domain_name)
+        return FakeDomain(self, domain_name)
+
+    def delete_domain(self, domain_or_name):
+        self._call('sdb.delete_domain')
+        with store.lock:
+            store.domains.pop(str(getattr(domain_or_name, 'name',
+                                          domain_or_name)), None)
+        return True
+
+    def _items(self, domain_or_name):
+        return store.domain(getattr(domain_or_name, 'name', domain_or_name))
+
+    def _domain(self, domain_or_name):
+        if isinstance(domain_or_name, FakeDomain):
+            return domain_or_name
+        return FakeDomain(self, domain_or_name)
+
+    @staticmethod
+    def _put(items, item_name, attributes, replace):
+        attrs = items.setdefault(item_name, {})
+        for key, value in attributes.iteritems():
+            if not isinstance(value, list):
+                value = [value]
+            value = [v if isinstance(v, basestring) else str(v)
+                     for v in value]
+            if replace or key not in attrs:
+                attrs[key] = value
+            else:
+                attrs[key] = attrs[key] + [v for v in value
+                                           if v not in attrs[key]]
+
+    @staticmethod
+    def _check_expected(attrs, expected_value):
+        if not expected_value:
+            return
+        name, value = expected_value
+        current = (attrs or {}).get(name)
+        if value is True:
+            ok = current is not None
+        elif value is False:
+            ok = current is None
+        else:
+            ok = current is not None and value in current
+        if not ok:
+            raise _error(409, 'Conflict', 'ConditionalCheckFailed')
+
+    def put_attributes(self, domain_or_name, item_name, attributes,
+                       replace=True, expected_value=None):
+        self._call('sdb.put_attributes')
+        with store.lock:
+            items = self._items(domain_or_name)
+            self._check_expected(items.get(item_name), expected_value)
+            self._put(items, item_name, attributes, replace)
+        return True
+
+    def batch_put_attributes(self, domain_or_name, items, replace=True):
+        self._call('sdb.batch_put_attributes')
+        if len(items) > 25:
+            raise _error(400, 'Bad Request', 'NumberSubmittedItemsExceeded')
+        with store.lock:
+            stored = self._items(domain_or_name)
+            for item_name, attributes in items.iteritems():
+                self._put(stored, item_name, attributes, replace)
+        return True
+
+    def get_attributes(self, domain_or_name, item_name, attribute_names=None,
+                       consistent_read=False, item=None):
+        self._call('sdb.get_attributes')
+        domain = self._domain(domain_or_name)
+        with store.lock:
+            attrs = self._items(domain_or_name).get(item_name, {})
+            return self._item(domain, item_name, attrs, attribute_names)
+
+    @staticmethod
+    def _item(domain, item_name, attrs, attribute_names=None):
+        item = Item(domain, item_name)
+        if isinstance(attribute_names, basestring):
+            attribute_names = [attribute_names]
+        for key, value in attrs.iteritems():
+            if attribute_names is not None and key not in attribute_names:
+                continue
+            item[key] = value[0] if len(value) == 1 else list(value)
+        return item
+
+    def delete_attributes(self, domain_or_name, item_name, attr_names=None,
+                          expected_value=None):
+        self._call('sdb.delete_attributes')
+        with store.lock:
+            items = self._items(domain_or_name)
+            self._check_expected(items.get(item_name), expected_value)
+            self._delete(items, item_name, attr_names)
+        return True
+
+    @staticmethod
+    def _delete(items, item_name, attr_names):
+        if item_name not in items:
+            return
+        if attr_names is None:
+            del items[item_name]
+            return
+        attrs = items[item_name]
+        if isinstance(attr_names, dict):
+            for key, value in attr_names.iteritems():
+                if key not in attrs:
+                    continue
+                if value is None:
+                    del attrs[key]
+                    continue
+                if not isinstance(value, list):
+                    value = [value]
+                attrs[key] = [v for v in attrs[key] if v not in value]
+                if not attrs[key]:
+                    del attrs[key]
+        else:
+            for key in attr_names:
+                attrs.pop(key, None)
+        if not attrs:
+            del items[item_name]
+
+    def batch_delete_attributes(self, domain_or_name, items):
+        self._call('sdb.batch_delete_attributes')
+        if len(items) > 25:
+            raise _error(400, 'Bad Request', 'NumberSubmittedItemsExceeded')
+        with store.lock:
+            stored = self._items(domain_or_name)
+            for item_name, attr_names in items.iteritems():
+                self._delete(stored, item_name, attr_names)
+        return True
+
+    def select(self, domain_or_name, query='', next_token=None,
+               consistent_read=False):
+        self._call('sdb.select')
+        domain = self._domain(domain_or_name)
+        parsed = _Query(query)
+        with store.lock:
+            matches = [(name, attrs) for name, attrs
+                       in self._items(parsed.domain).iteritems()
+                       if parsed.matches(name, attrs)]
+        result = ResultSet()
+        if parsed.columns == 'count':
+            item = Item(domain, 'Domain')
+            item['Count'] = str(len(matches))
+            result.append(item)
+            result.next_token = None
+            return result
+        if parsed.order_by is not None:
+            def key(match):
+                if parsed.order_by == 'itemName()':
+                    return match[0]
+                return match[1].get(parsed.order_by, [''])[0]
+            matches.sort(key=key, reverse=parsed.descending)
+        start = int(next_token or 0)
+        end = start + parsed.limit
+        for name, attrs in matches[start:end]:
+            result.append(self._item(domain, name, attrs, parsed.columns))
+        result.next_token = str(end) if end < len(matches) else None
+        return result
+
+
+class FakeDomain(object):
+    """In-memory stand-in for :class:`boto.sdb.domain.Domain`."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def put_attributes(self, item_name, attributes, replace=True,
+                       expected_value=None):
+        return self.connection.put_attributes(self, item_name, attributes,
+                                              replace, expected_value)
+
+    def batch_put_attributes(self, items, replace=True):
+        return self.connection.batch_put_attributes(self, items, replace)
+
+    def get_attributes(self, item_name, attribute_name=None,
+                       consistent_read=False, item=None):
+        return self.connection.get_attributes(self, item_name, attribute_name,
+                                              consistent_read)
+
+    def delete_attributes(self, item_name, attributes=None,
+                          expected_values=None):
+        return self.connection.delete_attributes(self, item_name, attributes,
+                                                 expected_values)
+
+    def batch_delete_attributes(self, items):
+        return self.connection.batch_delete_attributes(self, items)
+
+    def select(self, query='', next_token=None, consistent_read=False,
+               max_items=None):
+        """Returns an iterator over all items matching ``query``,
+        following the next tokens like :class:`boto.sdb.queryresultset.
+        SelectResultSet` does.
+
+        """
+        count = 0
+        while True:
+            page = self.connection.select(self, query, next_token,
+                                          consistent_read)
+            for item in page:
+                if max_items is not None and count >= max_items:
+                    return
+                count += 1
+                yield item
+            next_token = page.next_token
+            if not next_token:
+                return
+
+    def get_item(self, item_name, consistent_read=False):
+        item = self.get_attributes(item_name, consistent_read=consistent_read)
+        if item:
+            return item
+        return None
+
+
+def connect_iam(**kwargs):
+    """Returns a :class:`FakeIAMConnection`."""
+    return FakeIAMConnection()
+
+
+def connect_sdb(**kwargs):
+    """Returns a :class:`FakeSDBConnection`."""
+    return FakeSDBConnection()
+
+
+def connect_sts(aws_access_key_id=None, aws_secret_access_key=None,
+                **kwargs):
+    """Returns a :class:`FakeSTSConnection` signed with the given keys."""
+    return FakeSTSConnection(aws_access_key_id, aws_secret_access_key)
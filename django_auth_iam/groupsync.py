@@ -0,0 +1,180 @@
+"""
+django_auth_iam.groupsync
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module mirrors the membership of IAM groups into the groups of
+:mod:`django.contrib.auth`.
+
+Once the memberships are mirrored, the permissions of the local groups
+are checked by :class:`django.contrib.auth.backends.ModelBackend` from
+the local database, without calling IAM. Running the sync again only
+writes the memberships that have changed, so it can be run on a
+schedule.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+from itertools import islice
+
+from boto.exception import BotoServerError
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+
+from . import connections
+from .bulk import run_concurrently
+from .localusers import get_local_user_resolver
+from .permissions import get_permission_cache
+
+
+IAM_GROUP_SYNC_CONCURRENCY = getattr(settings, 'IAM_GROUP_SYNC_CONCURRENCY',
+                                     10)
+IAM_GROUP_SYNC_PAGE_SIZE = getattr(settings, 'IAM_GROUP_SYNC_PAGE_SIZE', 100)
+
+
+def iter_groups(page_size=None):
+    """Yield the names of all IAM groups, fetching ``page_size`` groups
+    at a time.
+
+    """
+    iam = connections.get_iam()
+    marker = None
+    while True:
+        response = iam.get_all_groups(marker=marker,
+                                      max_items=page_size or
+                                      IAM_GROUP_SYNC_PAGE_SIZE)
+        result = response['list_groups_response']['list_groups_result']
+        for group in result['groups']:
+            yield group['group_name']
+        if result.get('is_truncated') != 'true':
+            break
+        marker = result['marker']
+
+
+def iter_members(name, page_size=None):
+    """Yield the usernames of the members of the IAM group ``name``,
+    fetching ``page_size`` users at a time.
+
+    """
+    iam = connections.get_iam()
+    marker = None
+    while True:
+        response = iam.get_group(name, marker=marker,
+                                 max_items=page_size or
+                                 IAM_GROUP_SYNC_PAGE_SIZE)
+        result = response['get_group_response']['get_group_result']
+        for user in result['users']:
+            yield user['user_name']
+        if result.get('is_truncated') != 'true':
+            break
+        marker = result['marker']
+
+
+class GroupSync(object):
+    """Mirrors IAM group memberships into local Django groups.
+
+    IAM groups are read ``page_size`` at a time and the members of the
+    groups in a page are fetched by ``concurrency`` threads. Each page
+    is then compared with the local memberships and the difference is
+    written in a single transaction. Local groups and users are created
+    as needed, and the cached permissions of the users whose
+    memberships changed are invalidated.
+
+    """
+
+    def __init__(self, concurrency=None, page_size=None):
+        if concurrency is None:
+            concurrency = IAM_GROUP_SYNC_CONCURRENCY
+        if page_size is None:
+            page_size = IAM_GROUP_SYNC_PAGE_SIZE
+        self.concurrency = concurrency
+        self.page_size = page_size
+
+    def sync(self, names=None, prune=False):
+        """Sync the IAM groups named in ``names``, or all IAM groups if
+        ``names`` is ``None``.
+
+        Groups in ``names`` that do not exist in IAM lose all their
+        local members. If ``prune`` is true and all groups are synced,
+        the same is done for every local group that does not exist in
+        IAM.
+
+        Returns a dictionary with the number of groups synced, groups
+        created and memberships added and removed.
+
+        """
+        report = {'groups': 0, 'created': 0, 'added': 0, 'removed': 0}
+        if names is None:
+            source = iter_groups(self.page_size)
+        else:
+            source = iter(names)
+        seen = set()
+        while True:
+            batch = list(islice(source, self.page_size))
+            if not batch:
+                break
+            members = run_concurrently(self._fetch_members, batch,
+                                       self.concurrency)
+            self._apply(zip(batch, members), report)
+            seen.update(batch)
+        if prune and names is None:
+            stale = (Group.objects.exclude(name__in=seen)
+                     .filter(user__isnull=False).distinct()
+                     .values_list('name', flat=True))
+            self._apply([(name, None) for name in stale], report)
+        return report
+
+    def _fetch_members(self, name):
+        try:
+            return list(iter_members(name, self.page_size))
+        except BotoServerError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def _apply(self, members, report):
+        through = User.groups.through
+        with transaction.commit_on_success():
+            names = [name for name, usernames in members]
+            groups = dict(Group.objects.filter(name__in=names)
+                          .values_list('name', 'pk'))
+            for name, usernames in members:
+                if name not in groups and usernames is not None:
+                    groups[name] = Group.objects.create(name=name).pk
+                    report['created'] += 1
+            usernames = set()
+            for name, group_members in members:
+                usernames.update(group_members or ())
+            user_pks = get_local_user_resolver().get_pks(usernames)
+
+            wanted = set()
+            for name, group_members in members:
+                for username in group_members or ():
+                    wanted.add((groups[name], user_pks[username]))
+            current = set(through.objects
+                          .filter(group__in=groups.values())
+                          .values_list('group', 'user'))
+
+            changed = wanted ^ current
+            added = [through(group_id=group_pk, user_id=user_pk)
+                     for group_pk, user_pk in wanted - current]
+            if hasattr(through.objects, 'bulk_create'):
+                through.objects.bulk_create(added)
+            else:
+                for membership in added:
+                    membership.save()
+            removed = {}
+            for group_pk, user_pk in current - wanted:
+                removed.setdefault(group_pk, []).append(user_pk)
+            for group_pk, pks in removed.iteritems():
+                through.objects.filter(group=group_pk, user__in=pks).delete()
+        # The memberships are written through the intermediary model,
+        # which does not send m2m_changed.
+        get_permission_cache().invalidate(set(user_pk for group_pk, user_pk
+                                              in changed))
+
+        report['groups'] += len(members)
+        report['added'] += len(added)
+        report['removed'] += sum(len(pks) for pks in removed.itervalues())
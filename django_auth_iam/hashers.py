@@ -0,0 +1,280 @@
+"""
+django_auth_iam.hashers
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the password hashers used by
+:class:`~django_auth_iam.properties.BCryptPassword`.
+
+``IAM_PASSWORD_HASHERS`` lists the hashers in use. New passwords are
+hashed with the first one; stored hashes are verified with the hasher
+that recognizes their format, so changing the setting migrates users as
+they log in. Every hasher compares hashes with
+:func:`hmac.compare_digest` or the constant time verification of its
+library.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+import bcrypt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+
+from .utils import import_class
+
+
+IAM_PASSWORD_HASHERS = getattr(settings, 'IAM_PASSWORD_HASHERS',
+                               ('django_auth_iam.hashers.BCryptHasher',))
+IAM_BCRYPT_ROUNDS = getattr(settings, 'IAM_BCRYPT_ROUNDS', 12)
+
+
+class BaseHasher(object):
+    """Base class of the password hashers.
+
+    Hashers that need an optional module name it in :attr:`library`.
+    Subclasses may override the class attributes that set the cost of
+    the algorithm.
+
+    """
+
+    algorithm = None
+    """Name of the algorithm."""
+    prefixes = ()
+    """Prefixes of the hashes made by the algorithm."""
+    library = None
+    """Module required by the hasher or ``None``."""
+
+    def available(self):
+        """Returns ``True`` if :attr:`library` can be imported."""
+        try:
+            self._load_library()
+        except ImproperlyConfigured:
+            return False
+        return True
+
+    def _load_library(self):
+        if self.library is None:
+            return None
+        try:
+            return import_module(self.library)
+        except ImportError as e:
+            raise ImproperlyConfigured('{0} requires the {1} module: {2}'
+                                       .format(self.__class__.__name__,
+                                               self.library, e))
+
+    def identifies(self, encoded):
+        """Returns ``True`` if ``encoded`` was made by this hasher."""
+        return encoded.startswith(self.prefixes)
+
+    def encode(self, password):
+        """Returns the hash of ``password``."""
+        raise NotImplementedError
+
+    def verify(self, password, encoded):
+        """Returns ``True`` if ``password`` matches the hash
+        ``encoded``.
+
+        """
+        raise NotImplementedError
+
+    def needs_rehash(self, encoded):
+        """Returns ``True`` if ``encoded`` was made with other
+        parameters than the current ones.
+
+        """
+        return False
+
+
+class BCryptHasher(BaseHasher):
+    """Hashes passwords with bcrypt, using ``IAM_BCRYPT_ROUNDS`` as the
+    work factor. Verifies ``$2a$``, ``$2b$`` and ``$2y$`` hashes.
+
+    """
+
+    algorithm = 'bcrypt'
+    prefixes = ('$2a$', '$2b$', '$2y$')
+
+    def encode(self, password):
+        return bcrypt.hashpw(password, bcrypt.gensalt(IAM_BCRYPT_ROUNDS))
+
+    def verify(self, password, encoded):
+        # py-bcrypt only knows the $2a$ prefix. $2b$ and $2y$ only
+        # differ from it for passwords longer than 255 bytes.
+        salt = '$2a$' + encoded[4:]
+        return hmac.compare_digest(bcrypt.hashpw(password, salt)[4:],
+                                   encoded[4:])
+
+    @staticmethod
+    def rounds(encoded):
+        """Returns the work factor of ``encoded``."""
+        try:
+            return int(encoded.split('$')[2])
+        except (IndexError, ValueError):
+            return None
+
+    def needs_rehash(self, encoded):
+        return self.rounds(encoded) != IAM_BCRYPT_ROUNDS
+
+
+def _b64encode(value):
+    return base64.b64encode(value).rstrip('=')
+
+
+def _b64decode(value):
+    return base64.b64decode(value + '=' * (-len(value) % 4))
+
+
+class PBKDF2Hasher(BaseHasher):
+    """Hashes passwords with PBKDF2-HMAC-SHA256 from :mod:`hashlib`.
+    Cheaper to tune than bcrypt, as the cost grows linearly with
+    :attr:`iterations`.
+
+    """
+
+    algorithm = 'pbkdf2-sha256'
+    prefixes = ('$pbkdf2-sha256$',)
+    iterations = 100000
+
+    def _hash(self, password, salt, iterations):
+        if isinstance(password, unicode):
+            password = password.encode('utf8')
+        return _b64encode(hashlib.pbkdf2_hmac('sha256', password, salt,
+                                              iterations))
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        return '$pbkdf2-sha256${0}${1}${2}'.format(
+            self.iterations, _b64encode(salt),
+            self._hash(password, salt, self.iterations))
+
+    def verify(self, password, encoded):
+        iterations, salt, digest = encoded.split('$')[2:]
+        return hmac.compare_digest(
+            self._hash(password, _b64decode(salt), int(iterations)), digest)
+
+    def needs_rehash(self, encoded):
+        return int(encoded.split('$')[2]) != self.iterations
+
+
+class SCryptHasher(BaseHasher):
+    """Hashes passwords with the memory-hard scrypt function. Requires
+    the ``scrypt`` module.
+
+    """
+
+    algorithm = 'scrypt'
+    prefixes = ('$scrypt$',)
+    library = 'scrypt'
+    work_factor = 14
+    """Base 2 logarithm of the CPU/memory cost ``N``."""
+    block_size = 8
+    parallelism = 1
+
+    def _params(self):
+        return 'ln={0},r={1},p={2}'.format(self.work_factor, self.block_size,
+                                           self.parallelism)
+
+    def _hash(self, password, salt, params):
+        scrypt = self._load_library()
+        if isinstance(password, unicode):
+            password = password.encode('utf8')
+        params = dict(param.split('=') for param in params.split(','))
+        return _b64encode(scrypt.hash(password, salt,
+                                      1 << int(params['ln']),
+                                      int(params['r']), int(params['p']), 32))
+
+    def encode(self, password):
+        salt = os.urandom(16)
+        params = self._params()
+        return '$scrypt${0}${1}${2}'.format(
+            params, _b64encode(salt), self._hash(password, salt, params))
+
+    def verify(self, password, encoded):
+        params, salt, digest = encoded.split('$')[2:]
+        return hmac.compare_digest(
+            self._hash(password, _b64decode(salt), params), digest)
+
+    def needs_rehash(self, encoded):
+        return encoded.split('$')[2] != self._params()
+
+
+class Argon2Hasher(BaseHasher):
+    """Hashes passwords with Argon2id. Requires the ``argon2-cffi``
+    package.
+
+    """
+
+    algorithm = 'argon2'
+    prefixes = ('$argon2id$', '$argon2i$', '$argon2d$')
+    library = 'argon2'
+    time_cost = 2
+    memory_cost = 102400
+    """Memory used in KiB."""
+    parallelism = 8
+
+    def _hasher(self):
+        argon2 = self._load_library()
+        return argon2.PasswordHasher(time_cost=self.time_cost,
+                                     memory_cost=self.memory_cost,
+                                     parallelism=self.parallelism)
+
+    def encode(self, password):
+        return str(self._hasher().hash(password))
+
+    def verify(self, password, encoded):
+        exceptions = self._load_library().exceptions
+        try:
+            return self._hasher().verify(encoded, password)
+        except (exceptions.InvalidHash, exceptions.VerificationError):
+            return False
+
+    def needs_rehash(self, encoded):
+        return self._hasher().check_needs_rehash(encoded)
+
+
+_hashers = None
+_hashers_setting = None
+_hashers_lock = threading.Lock()
+
+def get_hashers():
+    """Returns instances of the hashers listed in
+    ``IAM_PASSWORD_HASHERS``.
+
+    """
+    global _hashers, _hashers_setting
+    with _hashers_lock:
+        if _hashers is None or _hashers_setting != IAM_PASSWORD_HASHERS:
+            if not IAM_PASSWORD_HASHERS:
+                raise ImproperlyConfigured('IAM_PASSWORD_HASHERS must '
+                                           'list at least one hasher')
+            hashers = [import_class(path, 'IAM_PASSWORD_HASHERS')()
+                       for path in IAM_PASSWORD_HASHERS]
+            for hasher in hashers:
+                hasher._load_library()
+            _hashers = hashers
+            _hashers_setting = IAM_PASSWORD_HASHERS
+        return _hashers
+
+
+def get_default_hasher():
+    """Returns the hasher used for new passwords."""
+    return get_hashers()[0]
+
+
+def identify_hasher(encoded):
+    """Returns the hasher that made the hash ``encoded``. Raises
+    :exc:`ValueError` if none of the hashers recognizes it.
+
+    """
+    for hasher in get_hashers():
+        if hasher.identifies(encoded):
+            return hasher
+    raise ValueError('unknown password hash format')
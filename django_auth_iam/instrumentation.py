@@ -0,0 +1,251 @@
+"""
+django_auth_iam.instrumentation
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides timings and counters for the authentication path
+and for the calls made to IAM and SimpleDB.
+
+Measurements are sent as Django signals and passed to the collectors
+named in ``IAM_INSTRUMENTATION_COLLECTORS``. A collector is any object
+with ``observe(name, value, labels)`` and ``increment(name, labels)``
+methods.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.dispatch import Signal
+
+from .utils import import_class
+
+
+IAM_INSTRUMENTATION_COLLECTORS = getattr(
+    settings, 'IAM_INSTRUMENTATION_COLLECTORS',
+    ('django_auth_iam.instrumentation.MetricsCollector',))
+
+
+phase_finished = Signal(providing_args=['phase', 'duration'])
+"""Sent when a phase of :meth:`~django_auth_iam.backends.AmazonIAMBackend.
+authenticate` has finished. ``duration`` is in seconds."""
+
+aws_call_finished = Signal(providing_args=['service', 'operation',
+                                           'duration', 'error'])
+"""Sent after every call to IAM or SimpleDB. ``error`` is the
+exception raised by the call or ``None``."""
+
+aws_call_retried = Signal(providing_args=['service', 'operation', 'attempt'])
+"""Sent when a failed call to IAM or SimpleDB is retried."""
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsCollector(object):
+    """Collects histograms and counters in memory and renders them in
+    the Prometheus text format.
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def observe(self, name, value, labels=None):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0.0,
+                    'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def increment(self, name, labels=None, value=1):
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def histogram(self, name, labels=None):
+        """Returns a dictionary with the cumulative bucket counts, the sum
+        and the count of a histogram, or ``None`` if nothing has been
+        observed.
+
+        """
+        with self._lock:
+            histogram = self._histograms.get(self._key(name, labels))
+            if histogram is None:
+                return None
+            return {'buckets': zip(self.buckets, histogram['buckets']),
+                    'sum': histogram['sum'], 'count': histogram['count']}
+
+    def counter(self, name, labels=None):
+        """Returns the value of a counter."""
+        with self._lock:
+            return self._counters[self._key(name, labels)]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(k, v)
+                              for k, v in labels) + '}'
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append('{0}{1} {2}'.format(name, self._labels(labels),
+                                                 value))
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, self._labels(labels, [('le', repr(bound))]),
+                        count))
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, self._labels(labels, [('le', '+Inf')]),
+                    histogram['count']))
+                lines.append('{0}_sum{1} {2!r}'.format(
+                    name, self._labels(labels), histogram['sum']))
+                lines.append('{0}_count{1} {2}'.format(
+                    name, self._labels(labels), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+_collectors = None
+_collectors_lock = threading.Lock()
+
+def get_collectors():
+    """Returns the collectors configured by
+    ``IAM_INSTRUMENTATION_COLLECTORS``.
+
+    """
+    global _collectors
+    if _collectors is None:
+        with _collectors_lock:
+            if _collectors is None:
+                _collectors = [import_class(path,
+                                            'IAM_INSTRUMENTATION_COLLECTORS')()
+                               for path in IAM_INSTRUMENTATION_COLLECTORS]
+    return _collectors
+
+
+def get_collector(cls=MetricsCollector):
+    """Returns the first configured collector that is an instance of
+    ``cls`` or ``None``.
+
+    """
+    for collector in get_collectors():
+        if isinstance(collector, cls):
+            return collector
+    return None
+
+
+@contextmanager
+def phase(name):
+    """Time the code in the ``with`` block as the authentication phase
+    ``name``.
+
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        for collector in get_collectors():
+            collector.observe('iam_authenticate_phase_seconds', duration,
+                              {'phase': name})
+        phase_finished.send(sender=None, phase=name, duration=duration)
+
+
+@contextmanager
+def aws_call(service, operation):
+    """Time and count the call to ``service`` made in the ``with``
+    block.
+
+    """
+    labels = {'service': service, 'operation': operation}
+    start = time.time()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        duration = time.time() - start
+        for collector in get_collectors():
+            collector.increment('iam_aws_calls_total', labels)
+            collector.observe('iam_aws_call_seconds', duration, labels)
+            if error is not None:
+                collector.increment('iam_aws_errors_total', labels)
+        aws_call_finished.send(sender=None, service=service,
+                               operation=operation, duration=duration,
+                               error=error)
+
+
+def retried(service, operation, attempt):
+    """Record that a call to ``service`` is retried."""
+    labels = {'service': service, 'operation': operation}
+    for collector in get_collectors():
+        collector.increment('iam_aws_retries_total', labels)
+    aws_call_retried.send(sender=None, service=service, operation=operation,
+                          attempt=attempt)
+
+
+class InstrumentedConnection(object):
+    """Wraps a :mod:`boto` connection and reports every call made
+    through it with :func:`aws_call`.
+
+    Domains returned by the connection are bound to the wrapper, so
+    calls made through them are reported as well.
+
+    """
+
+    DOMAIN_METHODS = ('lookup', 'get_domain', 'create_domain')
+
+    def __init__(self, connection, service):
+        self._connection = connection
+        self._service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self._connection, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        if name in self.DOMAIN_METHODS:
+            def get_domain(*args, **kwargs):
+                domain = attr(*args, **kwargs)
+                if domain is not None:
+                    domain.connection = self
+                return domain
+            return get_domain
+        def call(*args, **kwargs):
+            return self._invoke(name, attr, args, kwargs)
+        return call
+
+    def _invoke(self, operation, func, args, kwargs):
+        with aws_call(self._service, operation):
+            return func(*args, **kwargs)
@@ -0,0 +1,107 @@
+"""
+django_auth_iam.localusers
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module maps IAM users to local Django users.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+from .bulk import chunks
+from .cache import LRUCache
+
+
+IAM_LOCAL_USER_CACHE_SIZE = getattr(settings, 'IAM_LOCAL_USER_CACHE_SIZE',
+                                    10000)
+
+QUERY_BATCH_SIZE = 500
+
+
+class LocalUserResolver(object):
+    """Resolves usernames to local :class:`django.contrib.auth.models.User`
+    objects.
+
+    The primary key of each resolved user is cached, so once a user is
+    known a login only costs a primary key lookup. Users that do not
+    exist locally are created.
+
+    """
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = IAM_LOCAL_USER_CACHE_SIZE
+        self._pks = LRUCache(max_size)
+
+    def get_user(self, username):
+        """Returns the local user for ``username``, creating it if
+        needed.
+
+        """
+        pk = self._pks.get(username)
+        if pk is not None:
+            try:
+                return User.objects.get(pk=pk)
+            except User.DoesNotExist:
+                self._pks.delete(username)
+        user, created = User.objects.get_or_create(username=username)
+        self._pks.set(username, user.pk)
+        return user
+
+    def ensure_users(self, usernames):
+        """Make sure a local user exists for each of ``usernames``.
+
+        Missing users are created in bulk. Returns the number of users
+        that were created.
+
+        """
+        created = 0
+        for batch in chunks(set(usernames), QUERY_BATCH_SIZE):
+            created += self._ensure_batch(batch)[0]
+        return created
+
+    def get_pks(self, usernames):
+        """Returns a dictionary mapping each of ``usernames`` to the
+        primary key of its local user. Missing users are created in
+        bulk.
+
+        """
+        pks = {}
+        for batch in chunks(set(usernames), QUERY_BATCH_SIZE):
+            pks.update(self._ensure_batch(batch)[1])
+        return pks
+
+    def _ensure_batch(self, batch):
+        existing = dict(User.objects.filter(username__in=batch)
+                        .values_list('username', 'pk'))
+        missing = [User(username=name) for name in batch
+                   if name not in existing]
+        if missing:
+            if hasattr(User.objects, 'bulk_create'):
+                User.objects.bulk_create(missing)
+            else:
+                for user in missing:
+                    user.save()
+            existing = dict(User.objects.filter(username__in=batch)
+                            .values_list('username', 'pk'))
+        for name, pk in existing.iteritems():
+            self._pks.set(name, pk)
+        return len(missing), existing
+
+    def forget(self, username):
+        """Remove ``username`` from the cache."""
+        self._pks.delete(username)
+
+
+_resolver = None
+
+def get_local_user_resolver():
+    """Returns the shared :class:`LocalUserResolver`."""
+    global _resolver
+    if _resolver is None:
+        _resolver = LocalUserResolver()
+    return _resolver
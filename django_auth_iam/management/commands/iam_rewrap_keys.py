@@ -0,0 +1,110 @@
+"""
+django_auth_iam.management.commands.iam_rewrap_keys
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Wraps the encrypted secret keys of all users with the current master
+key.
+
+Each value is written on the condition that it has not changed since it
+was read, so a secret key re-encrypted by a password change while the
+command runs is skipped instead of overwritten.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import os
+import time
+from datetime import datetime
+from optparse import make_option
+
+from boto.exception import BotoServerError
+from django.core.management.base import CommandError, NoArgsCommand
+
+from django_auth_iam.backends import AmazonIAMBackend
+from django_auth_iam.bulk import chunks, run_concurrently
+from django_auth_iam.models import ISO8601, keyring, select_pages
+
+
+class Command(NoArgsCommand):
+    help = ('Wrap the encrypted secret keys of all users with the current '
+            'master key from IAM_MASTER_KEYS.')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--checkpoint', dest='checkpoint',
+                    help='File used to record progress. An interrupted run '
+                         'is resumed from this file.'),
+        make_option('--workers', dest='workers', type='int', default=4,
+                    help='Number of concurrent SimpleDB writers.'),
+        make_option('--page-size', dest='page_size', type='int', default=250,
+                    help='Number of users read from SimpleDB at a time.'),
+    )
+
+    def handle_noargs(self, **options):
+        if keyring.current_id is None:
+            raise CommandError('IAM_MASTER_KEYS is not set')
+        verbosity = int(options.get('verbosity', 1))
+        checkpoint = options.get('checkpoint')
+        user_class = AmazonIAMBackend().user_class
+
+        next_token = None
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                next_token = f.read().strip() or None
+            if verbosity > 0:
+                self.stdout.write('Resuming from {0}\n'.format(checkpoint))
+
+        def rewrap(batch):
+            # SimpleDB returns unicode; the values are base64 encoded.
+            values = keyring.rewrap_many([str(item['enc_secret_key'])
+                                          for item in batch])
+            # Setting modified makes the next sync of the local replicas
+            # pick up the new values.
+            modified = datetime.utcnow().strftime(ISO8601)
+            domain = user_class._manager.domain
+            skipped = 0
+            for item, value in zip(batch, values):
+                try:
+                    domain.put_attributes(
+                        item.name,
+                        {'enc_secret_key': value, 'modified': modified},
+                        replace=True,
+                        expected_value=['enc_secret_key',
+                                        item['enc_secret_key']])
+                except BotoServerError as e:
+                    if e.error_code != 'ConditionalCheckFailed':
+                        raise
+                    skipped += 1
+            return skipped
+
+        start = time.time()
+        seen = rewrapped = skipped = 0
+        pages = select_pages(user_class, ['enc_secret_key'],
+                             options['page_size'], next_token)
+        for items, next_token in pages:
+            stale = [item for item in items if item.get('enc_secret_key') and
+                     keyring.needs_rewrap(item['enc_secret_key'])]
+            conflicts = sum(run_concurrently(rewrap, chunks(stale),
+                                             options['workers']))
+            seen += len(items)
+            rewrapped += len(stale) - conflicts
+            skipped += conflicts
+            if checkpoint:
+                with open(checkpoint, 'w') as f:
+                    f.write(next_token or '')
+            if verbosity > 1:
+                elapsed = max(time.time() - start, 1e-6)
+                self.stdout.write('{0} users read, {1} rewrapped, {2:.1f} '
+                                  'users/sec\n'.format(seen, rewrapped,
+                                                       seen / elapsed))
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        if verbosity > 0:
+            elapsed = max(time.time() - start, 1e-6)
+            self.stdout.write('Rewrapped {0} of {1} users in {2:.1f} seconds '
+                              '({3:.1f} users/sec)\n'.format(
+                                  rewrapped, seen, elapsed, seen / elapsed))
+            if skipped:
+                self.stdout.write('Skipped {0} users whose secret key '
+                                  'changed while running; run the command '
+                                  'again to rewrap them\n'.format(skipped))
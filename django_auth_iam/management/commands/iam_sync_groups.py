@@ -0,0 +1,44 @@
+"""
+django_auth_iam.management.commands.iam_sync_groups
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Mirrors the membership of IAM groups into local Django groups.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from django_auth_iam.groupsync import GroupSync
+
+
+class Command(BaseCommand):
+    args = '[group ...]'
+    help = ('Mirror the members of the given IAM groups, or of all IAM '
+            'groups, into local Django groups.')
+    option_list = BaseCommand.option_list + (
+        make_option('--concurrency', dest='concurrency', type='int',
+                    help='Number of groups fetched from IAM concurrently.'),
+        make_option('--page-size', dest='page_size', type='int',
+                    help='Number of groups synced at a time.'),
+        make_option('--prune', dest='prune', action='store_true',
+                    default=False,
+                    help='Remove all members from local groups that do not '
+                         'exist in IAM.'),
+    )
+
+    def handle(self, *names, **options):
+        verbosity = int(options.get('verbosity', 1))
+        sync = GroupSync(options.get('concurrency'), options.get('page_size'))
+        start = time.time()
+        report = sync.sync(names or None, prune=options['prune'])
+        if verbosity > 0:
+            self.stdout.write('Synced {groups} groups in {0:.1f} seconds: '
+                              '{created} created, {added} memberships added, '
+                              '{removed} removed\n'
+                              .format(time.time() - start, **report))
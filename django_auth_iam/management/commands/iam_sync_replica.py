@@ -0,0 +1,41 @@
+"""
+django_auth_iam.management.commands.iam_sync_replica
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Copies the users that changed in SimpleDB to the local replica.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from django_auth_iam.backends import AmazonIAMBackend
+
+
+class Command(NoArgsCommand):
+    help = ('Copy the users that changed in SimpleDB since the last run to '
+            'the local replica at IAM_REPLICA_PATH.')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--full', dest='full', action='store_true',
+                    default=False,
+                    help='Copy all users and remove deleted users from the '
+                         'replica.'),
+        make_option('--page-size', dest='page_size', type='int', default=250,
+                    help='Number of users read from SimpleDB at a time.'),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        user_class = AmazonIAMBackend().user_class
+        start = time.time()
+        report = user_class.sync_replica(full=options['full'],
+                                         page_size=options['page_size'])
+        if verbosity > 0:
+            self.stdout.write('Synced the replica in {0:.1f} seconds: '
+                              '{updated} users updated, {deleted} deleted\n'
+                              .format(time.time() - start, **report))
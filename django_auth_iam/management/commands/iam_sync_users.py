@@ -0,0 +1,41 @@
+"""
+django_auth_iam.management.commands.iam_sync_users
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Creates a local Django user for every user stored in SimpleDB.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+from itertools import islice
+
+from django.core.management.base import NoArgsCommand
+
+from django_auth_iam.backends import AmazonIAMBackend
+from django_auth_iam.localusers import (QUERY_BATCH_SIZE,
+                                        get_local_user_resolver)
+
+
+class Command(NoArgsCommand):
+    help = 'Create local users for all users stored in SimpleDB.'
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        user_class = AmazonIAMBackend().user_class
+        resolver = get_local_user_resolver()
+        usernames = (user['username'] for user in
+                     user_class.iter_all(QUERY_BATCH_SIZE, ['username']))
+        total = created = 0
+        while True:
+            batch = list(islice(usernames, QUERY_BATCH_SIZE))
+            if not batch:
+                break
+            total += len(batch)
+            created += resolver.ensure_users(batch)
+            if verbosity > 1:
+                self.stdout.write('Synced {0} users\n'.format(total))
+        if verbosity > 0:
+            self.stdout.write('Synced {0} users, created {1} local users\n'
+                              .format(total, created))
@@ -10,17 +10,251 @@ This module provides user and group models.
 
 """
 
-import boto
+from datetime import datetime, timedelta
+
 from boto.exception import BotoServerError
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from boto.sdb.db.model import Model
-from boto.sdb.db.property import StringProperty
+from boto.sdb.db.property import DateTimeProperty, StringProperty
+
+from . import connections
+from .bulk import (BulkReport, BulkResult, chunks, item_attributes,
+                   run_concurrently)
+from .cache import NameIndex, NOT_FOUND, get_credential_cache
+from .properties import BCryptPassword, BCryptPasswordProperty
+from .replica import IAM_REPLICA_SYNC_OVERLAP, get_replica
+from .sts import get_sts_provider
+from .utils import KeyCipher, MasterKeyring, encrypt_key, decrypt_key
+
+
+IAM_MASTER_KEYS = getattr(settings, 'IAM_MASTER_KEYS', ())
+IAM_LEGACY_ITEM_LOOKUP = getattr(settings, 'IAM_LEGACY_ITEM_LOOKUP', True)
+
+keyring = MasterKeyring(IAM_MASTER_KEYS)
+"""The :class:`~django_auth_iam.utils.MasterKeyring` used to wrap the
+encrypted secret keys.
+
+"""
+
+user_index = NameIndex('user')
+"""Index of usernames to SimpleDB item ids."""
+group_index = NameIndex('group')
+"""Index of group names to SimpleDB item ids."""
+
+
+def _invalidate_credentials(username):
+    get_credential_cache().invalidate(username)
+    provider = get_sts_provider()
+    if provider is not None:
+        provider.invalidate(username)
+
+
+# Shared by User, UserSnapshot and ReplicaUser.
+def _get_secret_key(user, password):
+    return decrypt_key(keyring.unwrap(user.enc_secret_key), password)
+
+
+def _snapshot(user):
+    return UserSnapshot(user.id, user.username, user.access_key,
+                        user.enc_secret_key)
+
+
+ISO8601 = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _replicate(users):
+    replica = get_replica()
+    if replica is not None:
+        replica.put([{'username': user.username, 'id': user.id,
+                      'password': str(user.password) or None,
+                      'access_key': user.access_key,
+                      'enc_secret_key': user.enc_secret_key,
+                      'modified': user.modified.strftime(ISO8601)
+                                  if user.modified else None}
+                     for user in users])
+
+
+def _new_item(cls, item_name):
+    """Returns a new instance of ``cls`` for the item ``item_name``."""
+    obj = cls(item_name)
+    # Keep boto from fetching the item the first time a property is read.
+    obj._loaded = True
+    return obj
+
+
+def _put_new(obj, replace=False):
+    """Write the new item ``obj`` with a single ``PutAttributes`` call.
+
+    Unlike :meth:`boto.sdb.db.model.Model.put` this does not query
+    SimpleDB for items with the same unique values first. Unless
+    ``replace`` is set the call is conditional on the item not existing
+    yet; an item left behind by an earlier owner of the name is
+    replaced. Returns ``False`` if an existing item was replaced.
+
+    """
+    domain = obj._manager.domain
+    attrs = item_attributes(obj)
+    if not replace:
+        try:
+            domain.put_attributes(obj.id, attrs, replace=True,
+                                  expected_value=['__type__', False])
+            return True
+        except BotoServerError as e:
+            if e.error_code != 'ConditionalCheckFailed':
+                raise e
+    domain.put_attributes(obj.id, attrs, replace=True)
+    return False
+
+
+def _find_legacy_items(cls, item_name, **filters):
+    """Returns the items of ``cls`` matching ``filters`` that are stored
+    under another name than ``item_name``. Earlier versions stored items
+    under random names; they are replaced by ``item_name``.
+
+    """
+    return [obj for obj in cls.find(**filters) if obj.id != item_name]
+
+
+def _delete_items(objs):
+    for obj in objs:
+        Model.delete(obj)
+
+
+def _bulk_delete(cls, names, lookup, steps, concurrency):
+    """Delete the items of ``cls`` named ``names`` and what belongs to
+    them in IAM.
+
+    ``lookup`` returns the object of a name or ``None``, and ``steps``
+    is a list of ``(step, func)`` tuples; each ``func`` is called with
+    the name and may raise a 404 error if there was nothing to delete.
+    The steps are run by a pool of ``concurrency`` threads. The items
+    of the names whose steps all succeeded are then deleted in batches.
+
+    """
+    results = []
+    seen = set()
+    pending = []
+    for name in names:
+        result = BulkResult(name)
+        results.append(result)
+        if name in seen:
+            result.fail(ValueError('duplicate name "{0}"'.format(name)))
+            continue
+        seen.add(name)
+        pending.append(result)
+
+    def deprovision(result):
+        try:
+            result.obj = lookup(result.name)
+        except Exception as e:
+            result.fail(e)
+            return
+        for step, func in steps:
+            try:
+                func(result.name)
+            except Exception as e:
+                if getattr(e, 'status', None) != 404:
+                    result.steps[step] = 'failed'
+                    result.fail(e)
+                    return
+                result.steps[step] = 'missing'
+            else:
+                result.steps[step] = 'deleted'
+    run_concurrently(deprovision, pending, concurrency)
+
+    found = []
+    for result in pending:
+        if result.ok and result.obj is None:
+            result.steps['item'] = 'missing'
+        elif result.ok:
+            found.append(result)
+    domain = cls._manager.domain
+    for batch in chunks(found):
+        try:
+            domain.batch_delete_attributes(dict((r.obj.id, None)
+                                                for r in batch))
+        except BotoServerError as e:
+            for r in batch:
+                r.steps['item'] = 'failed'
+                r.fail(e)
+            continue
+        for r in batch:
+            r.steps['item'] = 'deleted'
+    for result in pending:
+        if result.ok:
+            deleted = 'deleted' in result.steps.values()
+            result.status = 'deleted' if deleted else 'missing'
+    return BulkReport(results)
+
+
+def select_pages(cls, attributes=None, page_size=250, next_token=None,
+                 filters=None):
+    """Yield the items of ``cls`` one page at a time.
+
+    Yields ``(items, next_token)`` tuples, where ``next_token`` can be
+    passed back in to resume after that page. Only the attributes named
+    in ``attributes`` are fetched, or all attributes if it is ``None``.
+    ``filters`` is a list of ``(property operator, value)`` tuples as
+    taken by :meth:`boto.sdb.db.query.Query.filter`.
+
+    """
+    manager = cls._manager
+    if attributes:
+        columns = ', '.join('`{0}`'.format(name) for name in attributes)
+    else:
+        columns = '*'
+    query = 'select {0} from `{1}` {2} limit {3}'.format(
+        columns, manager.db_name,
+        manager._build_filter_part(cls, filters or []),
+        page_size)
+    domain = manager.domain
+    while True:
+        items = manager.sdb.select(domain, query, next_token=next_token,
+                                   consistent_read=bool(manager.consistent))
+        next_token = items.next_token
+        yield list(items), next_token
+        if not next_token:
+            break
+
+
+def _iter_pages(cls, page_size, attributes, next_token):
+    """Yield the items of ``cls`` one page at a time as
+    ``(objects, next_token)`` tuples. See :meth:`User.iter_pages`.
 
-from .properties import BCryptPasswordProperty
-from .utils import encrypt_key, decrypt_key
+    """
+    manager = cls._manager
+    props = None
+    if attributes is not None:
+        props = [cls.find_property(name) for name in attributes]
+        if None in props:
+            raise ValueError('unknown attribute "{0}"'.format(
+                attributes[props.index(None)]))
+    for items, next_token in select_pages(cls, attributes, page_size,
+                                          next_token):
+        if props is None:
+            objs = [manager.get_object(cls, item.name, item)
+                    for item in items]
+        else:
+            objs = [_project(manager, item, props) for item in items]
+        yield objs, next_token
+
+
+def _project(manager, item, props):
+    values = {'id': item.name}
+    for prop in props:
+        value = item.get(prop.name)
+        if value is not None:
+            value = prop.make_value_from_datastore(
+                manager.decode_value(prop, value))
+        values[prop.name] = value
+    return values
 
 
 class User(Model):
 
+    __metaclass__ = connections.PooledModelMeta
+
     username = StringProperty(required=True, unique=True)
     """Username for the user."""
     password = BCryptPasswordProperty()
@@ -50,53 +284,281 @@ class User(Model):
     """Access key to Amazon services."""
     enc_secret_key = StringProperty()
     """Encrypted secret key to Amazon services."""
+    modified = DateTimeProperty(auto_now=True)
+    """Time of the last change, used to sync the local replica."""
+
+    REPLICA_ATTRIBUTES = ['username', 'password', 'access_key',
+                          'enc_secret_key', 'modified']
 
     class AlreadyExist(Exception):
         def __init__(self, username):
             Exception.__init__(self, 'a user with the username "{0}" already '
                                'exist'.format(username))
 
+    @staticmethod
+    def item_name(username):
+        """Returns the SimpleDB item name of the user ``username``.
+
+        Users created before item names were derived from the username
+        have random item names and are found with a Select query.
+
+        """
+        return 'user:' + username
+
     def get_secret_key(self, password):
         """Get the decrypted secret key.
 
-        :param password: the unhashed password for the user.
+        :param password: the unhashed password for the user, or a
+            :class:`~django_auth_iam.utils.KeyCipher` made from it.
 
         """
-        return decrypt_key(self.enc_secret_key, password)
+        return _get_secret_key(self, password)
+
+    def put(self, expected_value=None):
+        """Store the user in SimpleDB and in the local replica."""
+        super(User, self).put(expected_value)
+        _replicate([self])
+        return self
+
+    def snapshot(self):
+        """Returns a :class:`UserSnapshot` of this user."""
+        return _snapshot(self)
 
     @classmethod
     def get_by_username(cls, username):
         """Get a user by username. Returns ``None`` if the user is
         not found.
 
+        The item id of the user is looked up in :data:`user_index`,
+        then the item named :meth:`item_name` is fetched, before
+        SimpleDB is queried.
+
         """
-        user = tuple(cls.find(username=username, limit=1))
-        if len(user) == 0:
+        if not username:
+            return None
+        item_id = user_index.get(username)
+        if item_id is NOT_FOUND:
             return None
-        return user[0]
+        if item_id is not None:
+            user = cls.get_by_id(item_id)
+            if user is not None and user.username == username:
+                return user
+            user_index.invalidate(username)
+        if item_id != cls.item_name(username):
+            user = cls.get_by_id(cls.item_name(username))
+            if user is not None and user.username == username:
+                user_index.set(username, user.id)
+                return user
+        user = next(iter(cls.find(username=username, limit=1)), None)
+        if user is None:
+            user_index.set_missing(username)
+            return None
+        user_index.set(username, user.id)
+        return user
+
+    @classmethod
+    def iter_pages(cls, page_size=250, attributes=None, next_token=None):
+        """Yield all users one page of at most ``page_size`` users at a
+        time, as ``(users, next_token)`` tuples. Pass ``next_token`` back
+        in to continue after that page, e.g. in the next request of a
+        paginated listing; it is ``None`` after the last page.
+
+        If ``attributes`` is a list of property names, only those are
+        fetched from SimpleDB and each user is a dictionary with the
+        item ``id`` and the values of those properties. Otherwise the
+        users are :class:`User` instances.
+
+        """
+        return _iter_pages(cls, page_size, attributes, next_token)
+
+    @classmethod
+    def iter_all(cls, page_size=250, attributes=None):
+        """Yield all users, fetching ``page_size`` users at a time. See
+        :meth:`iter_pages` for ``attributes``.
+
+        """
+        for users, next_token in cls.iter_pages(page_size, attributes):
+            for user in users:
+                yield user
+
+    @classmethod
+    def get_from_replica(cls, username):
+        """Get a user from the local replica. Returns a
+        :class:`ReplicaUser` or ``None`` if there is no replica or the
+        user is not in it.
+
+        """
+        replica = get_replica()
+        if replica is None:
+            return None
+        row = replica.get(username)
+        if row is None or not row['password']:
+            return None
+        return ReplicaUser(row['id'], row['username'], row['access_key'],
+                           row['enc_secret_key'],
+                           BCryptPassword(row['password']))
+
+    @classmethod
+    def sync_replica(cls, full=False, page_size=250):
+        """Copy the users that changed since the last sync from SimpleDB
+        to the local replica.
+
+        The first sync, and every sync with ``full`` set, copies all
+        users and removes the users that no longer exist. Returns a
+        dictionary with the number of users ``updated`` and
+        ``deleted``.
+
+        """
+        replica = get_replica()
+        if replica is None:
+            raise ImproperlyConfigured('IAM_REPLICA_PATH is not set')
+        started = datetime.utcnow()
+        since = None if full else replica.get_meta('synced_at')
+        filters = []
+        if since is not None:
+            # Allow for clock skew between the hosts writing the users.
+            since = (datetime.strptime(since, ISO8601) -
+                     timedelta(seconds=IAM_REPLICA_SYNC_OVERLAP))
+            filters.append(('modified >=', since))
+        usernames = []
+        updated = deleted = 0
+        for items, next_token in select_pages(cls, cls.REPLICA_ATTRIBUTES,
+                                              page_size, filters=filters):
+            rows = [{'username': item['username'], 'id': item.name,
+                     'password': item.get('password'),
+                     'access_key': item.get('access_key'),
+                     'enc_secret_key': item.get('enc_secret_key'),
+                     'modified': item.get('modified')}
+                    for item in items if item.get('username')]
+            replica.put(rows)
+            updated += len(rows)
+            if since is None:
+                usernames.extend(row['username'] for row in rows)
+        if since is None:
+            deleted = replica.delete_except(usernames)
+        replica.set_meta('synced_at', started.strftime(ISO8601))
+        return {'updated': updated, 'deleted': deleted}
 
     @classmethod
     def create(cls, username, password, force=False):
         """Create a new user. Raises :exc:`.User.AlreadyExist` if the
         user already exist in IAM.
 
+        The user is stored under :meth:`item_name` with a single
+        conditional write. Unless ``IAM_LEGACY_ITEM_LOOKUP`` is disabled,
+        SimpleDB is first queried for an item of the user stored by an
+        earlier version, which is deleted.
+
         May also raise :class:`boto.exception.BotoServerError`.
         """
         if force:
             cls._delete_iam_user(username)
+            _invalidate_credentials(username)
         cls._create_iam_user(username)
-        user = cls.get_by_username(username)
+        legacy = []
+        if force or IAM_LEGACY_ITEM_LOOKUP:
+            legacy = _find_legacy_items(cls, cls.item_name(username),
+                                        username=username)
+        user = _new_item(cls, cls.item_name(username))
+        user.username = username
+        user.password = password
+        cls._create_access_key(user, password)
+        if not _put_new(user, replace=force):
+            # The item belonged to an IAM user deleted outside of Django.
+            _invalidate_credentials(username)
+        _delete_items(legacy)
+        _replicate([user])
+        user_index.set(username, user.id)
+        return user
+
+    @classmethod
+    def bulk_create(cls, users, concurrency=10):
+        """Create many users at once.
+
+        :param users: an iterable of ``(username, password)`` tuples.
+        :param concurrency: the number of users provisioned in IAM
+                            concurrently.
+
+        The IAM calls are made by a pool of ``concurrency`` threads and
+        the users are written to SimpleDB in batches of 25. Returns a
+        :class:`~django_auth_iam.bulk.BulkReport` with the outcome for
+        each username. Users that already exist in both IAM and
+        SimpleDB are reported as ``'exists'`` and left untouched, so
+        the operation can safely be run again after a partial failure.
+
+        """
+        results = []
+        seen = set()
+        jobs = []
+        for username, password in users:
+            result = BulkResult(username)
+            results.append(result)
+            if username in seen:
+                result.fail(ValueError('duplicate username "{0}"'
+                                       .format(username)))
+                continue
+            seen.add(username)
+            jobs.append((result, password))
+
+        legacy = {}
+
+        def provision(job):
+            result, password = job
+            try:
+                result.obj = cls._provision_iam_user(result.name, password)
+                result.status = 'created' if result.obj else 'exists'
+                if (result.obj and IAM_LEGACY_ITEM_LOOKUP and
+                        result.obj.id == cls.item_name(result.name)):
+                    legacy[result.name] = _find_legacy_items(
+                        cls, result.obj.id, username=result.name)
+            except Exception as e:
+                result.fail(e)
+        run_concurrently(provision, jobs, concurrency)
+
+        created = [r for r in results if r.status == 'created']
+        domain = cls._manager.domain
+        for batch in chunks(created):
+            items = dict((r.obj.id, item_attributes(r.obj)) for r in batch)
+            try:
+                domain.batch_put_attributes(items, replace=True)
+            except BotoServerError as e:
+                for r in batch:
+                    r.fail(e)
+                continue
+            for r in batch:
+                _delete_items(legacy.get(r.name, ()))
+                user_index.set(r.name, r.obj.id)
+            _replicate(r.obj for r in batch)
+        return BulkReport(results)
+
+    @classmethod
+    def _provision_iam_user(cls, username, password):
+        """Create the IAM user and an access key for ``username`` and
+        return an unsaved user. Returns ``None`` if the user already
+        exists in both IAM and SimpleDB.
+
+        """
+        try:
+            cls._create_iam_user(username)
+        except cls.AlreadyExist:
+            user = cls.get_by_username(username)
+            if user is not None and user.access_key:
+                return None
+            # The IAM user was created by an earlier, failed run. Its
+            # access keys are unusable as their secrets are lost.
+            cls._delete_access_keys(username)
+        else:
+            user = None
         if user is None:
-            user = cls()
+            user = _new_item(cls, cls.item_name(username))
         user.username = username
         user.password = password
         cls._create_access_key(user, password)
-        user.put()
         return user
 
     @classmethod
     def _create_iam_user(cls, username):
-        iam = boto.connect_iam()
+        iam = connections.get_iam()
         try:
             iam.create_user(username)
         except BotoServerError as e:
@@ -107,14 +569,53 @@ class User(Model):
 
     @staticmethod
     def _create_access_key(user, password):
-        iam = boto.connect_iam()
+        iam = connections.get_iam()
         response = iam.create_access_key(user.username)
         result = response['create_access_key_response']['create_access_key_result']
         access_key = result['access_key']['access_key_id']
         secret_key = result['access_key']['secret_access_key']
         enc_secret_key = encrypt_key(secret_key.encode('utf8'), password)
         user.access_key = access_key
-        user.enc_secret_key = enc_secret_key
+        user.enc_secret_key = keyring.wrap(enc_secret_key)
+
+    @classmethod
+    def bulk_delete(cls, usernames, concurrency=10):
+        """Delete many users at once from IAM and SimpleDB.
+
+        :param usernames: an iterable of usernames.
+        :param concurrency: the number of users deleted in IAM
+                            concurrently.
+
+        The access keys and the IAM users are deleted by a pool of
+        ``concurrency`` threads and the users are deleted from SimpleDB
+        in batches of 25. A user is only deleted from SimpleDB once its
+        IAM user is gone, so the operation can safely be run again
+        after a partial failure.
+
+        Returns a :class:`~django_auth_iam.bulk.BulkReport`. The
+        :attr:`~django_auth_iam.bulk.BulkResult.steps` of each result
+        record the outcome of the ``'access_keys'``, ``'iam_user'`` and
+        ``'item'`` steps. Users found nowhere are reported as
+        ``'missing'``.
+
+        """
+        iam_steps = [
+            ('access_keys', lambda name: cls._delete_access_keys(name, 1)),
+            ('iam_user', lambda name: connections.get_iam().delete_user(name)),
+        ]
+        report = _bulk_delete(cls, usernames, cls.get_by_username, iam_steps,
+                              concurrency)
+        deleted = []
+        for result in report:
+            # Keys may already be gone while cached logins still work.
+            _invalidate_credentials(result.name)
+            if result.ok:
+                user_index.invalidate(result.name)
+                deleted.append(result.name)
+        replica = get_replica()
+        if replica is not None:
+            replica.delete(deleted)
+        return report
 
     def delete(self):
         """Delete the user from IAM and SimpleDB.
@@ -123,18 +624,30 @@ class User(Model):
 
         """
         User._delete_iam_user(self.username)
+        _invalidate_credentials(self.username)
         super(User, self).delete()
+        user_index.invalidate(self.username)
+        replica = get_replica()
+        if replica is not None:
+            replica.delete([self.username])
+
+    @staticmethod
+    def _delete_access_keys(username, concurrency=None):
+        iam = connections.get_iam()
+        response = iam.get_all_access_keys(username)
+        key_ids = [k['access_key_id'] for k in
+                   response['list_access_keys_response']
+                   ['list_access_keys_result']['access_key_metadata']]
+
+        def delete(key):
+            connections.get_iam().delete_access_key(key, username)
+        run_concurrently(delete, key_ids, concurrency or len(key_ids))
 
     @staticmethod
     def _delete_iam_user(username):
         try:
-            iam = boto.connect_iam()
-            response = iam.get_all_access_keys(username)
-            key_ids = [k['access_key_id'] for k in
-                       response['list_access_keys_response']
-                       ['list_access_keys_result']['access_key_metadata']]
-            for key in key_ids:
-                iam.delete_access_key(key, username)
+            User._delete_access_keys(username)
+            iam = connections.get_iam()
             iam.delete_user(username)
         except BotoServerError as e:
             if e.status != 404:
@@ -149,12 +662,100 @@ class User(Model):
 
         """
         self.password = new_password
-        secret_key = self.get_secret_key(cur_password)
-        self.enc_secret_key = encrypt_key(secret_key, new_password)
+        secret_key = KeyCipher(cur_password).decrypt(
+            keyring.unwrap(self.enc_secret_key))
+        self.enc_secret_key = keyring.wrap(
+            KeyCipher(new_password).encrypt(secret_key))
+        get_credential_cache().invalidate(self.username)
+
+    @classmethod
+    def rehash_password(cls, user, password):
+        """Store ``password`` hashed with the current hasher for
+        ``user``, the :class:`User` or :class:`ReplicaUser` whose hash
+        ``password`` was verified against.
+
+        Only the hash is written, and only if the stored hash is still
+        the one that was verified, so a password changed since then is
+        not overwritten. Returns ``False`` if it was changed.
+
+        """
+        hashed = BCryptPassword()
+        hashed.set(password)
+        modified = datetime.utcnow().strftime(ISO8601)
+        try:
+            cls._manager.domain.put_attributes(
+                user.id, {'password': str(hashed), 'modified': modified},
+                replace=True, expected_value=['password', str(user.password)])
+        except BotoServerError as e:
+            if e.error_code != 'ConditionalCheckFailed':
+                raise e
+            return False
+        if get_replica() is not None:
+            current = cls.get_by_id(user.id)
+            if current is not None:
+                _replicate([current])
+        return True
+
+
+class UserSnapshot(object):
+    """A read-only copy of the fields of a :class:`User` needed once the
+    password has been verified.
+
+    The backend keeps snapshots instead of the full models, which hold
+    a reference to their manager and every property value.
+
+    """
+
+    __slots__ = ('id', 'username', 'access_key', 'enc_secret_key')
+
+    def __init__(self, id, username, access_key, enc_secret_key):
+        self.id = id
+        self.username = username
+        self.access_key = access_key
+        self.enc_secret_key = enc_secret_key
+
+    def get_secret_key(self, password):
+        """Get the decrypted secret key.
+
+        :param password: the unhashed password for the user, or a
+            :class:`~django_auth_iam.utils.KeyCipher` made from it.
+
+        """
+        return _get_secret_key(self, password)
+
+    def get_user(self):
+        """Load the :class:`User` from SimpleDB."""
+        return User.get_by_id(self.id)
+
+    def __repr__(self):
+        return '<UserSnapshot {0}>'.format(self.username)
+
+
+class ReplicaUser(UserSnapshot):
+    """A :class:`UserSnapshot` read from the local replica, with the
+    password hash needed to verify a login.
+
+    """
+
+    __slots__ = ('password',)
+
+    def __init__(self, id, username, access_key, enc_secret_key, password):
+        super(ReplicaUser, self).__init__(id, username, access_key,
+                                          enc_secret_key)
+        self.password = password
+
+    def snapshot(self):
+        """Returns a :class:`UserSnapshot` of this user."""
+        return _snapshot(self)
+
+    def __repr__(self):
+        return '<ReplicaUser {0}>'.format(self.username)
 
 
 class Group(Model):
 
+    __metaclass__ = connections.PooledModelMeta
+
     name = StringProperty(required=True, unique=True)
     """Group name."""
 
@@ -163,42 +764,112 @@ class Group(Model):
             Exception.__init__(self, 'a group with the name "{0}" already exist'
                                .format(name))
 
+    @staticmethod
+    def item_name(name):
+        """Returns the SimpleDB item name of the group ``name``."""
+        return 'group:' + name
+
     @classmethod
     def get_by_name(cls, name):
-        """Get a group by name. Returns ``None`` if the group is not found."""
-        group = tuple(cls.find(name=name, limit=1))
-        if len(group) == 0:
+        """Get a group by name. Returns ``None`` if the group is not found.
+
+        The item id of the group is looked up in :data:`group_index`,
+        then the item named :meth:`item_name` is fetched, before
+        SimpleDB is queried.
+
+        """
+        if not name:
             return None
-        return group[0]
+        item_id = group_index.get(name)
+        if item_id is NOT_FOUND:
+            return None
+        if item_id is not None:
+            group = cls.get_by_id(item_id)
+            if group is not None and group.name == name:
+                return group
+            group_index.invalidate(name)
+        if item_id != cls.item_name(name):
+            group = cls.get_by_id(cls.item_name(name))
+            if group is not None and group.name == name:
+                group_index.set(name, group.id)
+                return group
+        group = next(iter(cls.find(name=name, limit=1)), None)
+        if group is None:
+            group_index.set_missing(name)
+            return None
+        group_index.set(name, group.id)
+        return group
+
+    @classmethod
+    def iter_pages(cls, page_size=250, attributes=None, next_token=None):
+        """Yield all groups one page at a time, as ``(groups,
+        next_token)`` tuples. See :meth:`User.iter_pages`.
+
+        """
+        return _iter_pages(cls, page_size, attributes, next_token)
+
+    @classmethod
+    def iter_all(cls, page_size=250, attributes=None):
+        """Yield all groups, fetching ``page_size`` groups at a time. See
+        :meth:`User.iter_pages` for ``attributes``.
+
+        """
+        for groups, next_token in cls.iter_pages(page_size, attributes):
+            for group in groups:
+                yield group
 
     @classmethod
     def create(cls, name, force=False):
         """Create a new group. Raises :exc:`.Group.AlreadyExist` if
         the group already exist in IAM.
 
+        The group is stored under :meth:`item_name` like the users of
+        :meth:`User.create`.
+
         May also raise :class:`boto.exception.BotoServerError`.
 
         """
         if force:
             cls._delete_iam_group(name)
         cls._create_iam_group(name)
-        group = cls.get_by_name(name)
-        if group is None:
-            group = cls()
-        group.put()
+        legacy = []
+        if force or IAM_LEGACY_ITEM_LOOKUP:
+            legacy = _find_legacy_items(cls, cls.item_name(name), name=name)
+        group = _new_item(cls, cls.item_name(name))
+        group.name = name
+        _put_new(group, replace=force)
+        _delete_items(legacy)
+        group_index.set(name, group.id)
         return group
 
     @classmethod
     def _create_iam_group(cls, name):
-        iam = boto.connect_iam()
+        iam = connections.get_iam()
         try:
             iam.create_group(name)
         except BotoServerError as e:
             if e.status == 409:
-                raise cls.AlreadyExist(username)
+                raise cls.AlreadyExist(name)
             else:
                 raise e
 
+    @classmethod
+    def bulk_delete(cls, names, concurrency=10):
+        """Delete many groups at once from IAM and SimpleDB.
+
+        Works like :meth:`User.bulk_delete`, with the ``'iam_group'``
+        and ``'item'`` steps.
+
+        """
+        def delete_iam_group(name):
+            connections.get_iam().delete_group(name)
+        report = _bulk_delete(cls, names, cls.get_by_name,
+                              [('iam_group', delete_iam_group)], concurrency)
+        for result in report:
+            if result.ok:
+                group_index.invalidate(result.name)
+        return report
+
     def delete(self):
         """Delete the group from IAM and SimpleDB.
 
@@ -207,11 +878,12 @@ class Group(Model):
         """
         Group._delete_iam_group(self.name)
         super(Group, self).delete()
+        group_index.invalidate(self.name)
 
     @staticmethod
     def _delete_iam_group(name):
         try:
-            iam = boto.connect_iam()
+            iam = connections.get_iam()
             iam.delete_group(name)
         except BotoServerError as e:
             if e.status != 404:
@@ -0,0 +1,145 @@
+"""
+django_auth_iam.permissions
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a cache of the permissions of local users that is
+shared between requests and processes through Django's cache.
+
+Each entry holds all permissions of one user together with the
+permission version it was computed for. Changes that affect a single
+user delete that user's entry, while changes to the permissions of a
+group bump the version, which invalidates all entries at once. Reading
+the permissions of a user costs a single ``get_many`` call.
+
+Entries are only invalidated by the process that made the change, so the
+cache is disabled unless ``IAM_PERMISSION_CACHE_TTL`` is set, and must
+then be a cache shared by all processes, such as memcached.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache as django_cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+IAM_PERMISSION_CACHE_TTL = getattr(settings, 'IAM_PERMISSION_CACHE_TTL', 0)
+
+VERSION_KEY = 'django_auth_iam:perms:version'
+
+
+class PermissionCache(object):
+    """Cache of the permissions of local users, keyed on the primary
+    key of the user and the permission version.
+
+    Entries expire after ``ttl`` seconds. A ``ttl`` of ``0`` disables
+    the cache.
+
+    """
+
+    def __init__(self, ttl=None):
+        if ttl is None:
+            ttl = IAM_PERMISSION_CACHE_TTL
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_pk):
+        return 'django_auth_iam:perms:user:{0}'.format(user_pk)
+
+    def _new_version(self):
+        # Versions are based on the clock, so a version that has been
+        # evicted from the cache is never reused.
+        version = int(time.time() * 1000)
+        if not django_cache.add(VERSION_KEY, version, self.ttl):
+            version = django_cache.get(VERSION_KEY, version)
+        return version
+
+    def get(self, user_pk):
+        """Returns a ``(version, permissions)`` tuple, where
+        ``permissions`` is ``None`` if no valid entry is cached. The
+        version must be passed to :meth:`set`.
+
+        """
+        if not self.ttl:
+            return None, None
+        key = self._key(user_pk)
+        values = django_cache.get_many([VERSION_KEY, key])
+        version = values.get(VERSION_KEY)
+        if version is None:
+            return self._new_version(), None
+        entry = values.get(key)
+        if entry is None or entry[0] != version:
+            return version, None
+        return version, entry[1]
+
+    def set(self, user_pk, version, permissions):
+        """Store the ``permissions`` of the user computed for
+        ``version``.
+
+        """
+        if self.ttl and version is not None:
+            django_cache.set(self._key(user_pk), (version, permissions),
+                             self.ttl)
+
+    def invalidate(self, user_pks):
+        """Forget the permissions of the users in ``user_pks``."""
+        if self.ttl:
+            django_cache.delete_many([self._key(pk) for pk in user_pks])
+
+    def invalidate_all(self):
+        """Forget the permissions of all users."""
+        if not self.ttl:
+            return
+        try:
+            django_cache.incr(VERSION_KEY)
+        except ValueError:
+            self._new_version()
+
+
+_permission_cache = None
+
+def get_permission_cache():
+    """Returns the shared :class:`PermissionCache`."""
+    global _permission_cache
+    if _permission_cache is None:
+        _permission_cache = PermissionCache()
+    return _permission_cache
+
+
+def _user_changed(sender, instance, **kwargs):
+    get_permission_cache().invalidate([instance.pk])
+
+
+def _permissions_changed(sender, **kwargs):
+    get_permission_cache().invalidate_all()
+
+
+def _user_m2m_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # A group or permission was changed, which may affect any user.
+        get_permission_cache().invalidate_all()
+    else:
+        get_permission_cache().invalidate([instance.pk])
+
+
+post_save.connect(_user_changed, sender=User,
+                  dispatch_uid='django_auth_iam.permissions.user_saved')
+post_delete.connect(_user_changed, sender=User,
+                    dispatch_uid='django_auth_iam.permissions.user_deleted')
+post_delete.connect(_permissions_changed, sender=Group,
+                    dispatch_uid='django_auth_iam.permissions.group_deleted')
+post_delete.connect(_permissions_changed, sender=Permission,
+                    dispatch_uid='django_auth_iam.permissions.perm_deleted')
+m2m_changed.connect(_user_m2m_changed, sender=User.groups.through,
+                    dispatch_uid='django_auth_iam.permissions.user_groups')
+m2m_changed.connect(_user_m2m_changed, sender=User.user_permissions.through,
+                    dispatch_uid='django_auth_iam.permissions.user_perms')
+m2m_changed.connect(_permissions_changed, sender=Group.permissions.through,
+                    dispatch_uid='django_auth_iam.permissions.group_perms')
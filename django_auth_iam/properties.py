@@ -10,26 +10,37 @@ This module provides custom models properties.
 
 """
 
-import bcrypt
-
 from boto.sdb.db.property import Property, StringProperty, PasswordProperty
 from boto.utils import Password
 
+from .hashers import BCryptHasher, get_default_hasher, identify_hasher
+from .verification import get_verification_executor
+
 
 class BCryptPassword(Password):
+    """A password hash.
+
+    Despite the name, the hash is made by the first hasher in
+    ``IAM_PASSWORD_HASHERS``, which is bcrypt by default, and verified
+    by the hasher that recognizes its format. See
+    :mod:`django_auth_iam.hashers`.
+
+    """
 
     def __init__(self, hash=None, hashfunc=None):
         if hash and not '$' in hash:
             raise ValueError('hash does not look like a proper bcrypt hash')
         elif hash is None:
             hash = ''
-        super(BCryptPassword, self).__init__(hash, hashfunc)
+        # Hashes read from SimpleDB are unicode; the hashers expect
+        # byte strings.
+        super(BCryptPassword, self).__init__(str(hash), hashfunc)
 
     def set(self, value):
         """Set the password.
 
-        The password will be hashed with the bcrypt algorithm before
-        being stored.
+        The password will be hashed with the first hasher in
+        ``IAM_PASSWORD_HASHERS`` before being stored.
 
         """
         if not isinstance(value, basestring):
@@ -37,11 +48,59 @@ class BCryptPassword(Password):
         if not value:
             self.str = ''
         else:
-            self.str = bcrypt.hashpw(value, bcrypt.gensalt())
+            self.str = get_default_hasher().encode(value)
 
     def is_invalid(self):
         return self.str == ''
 
+    @property
+    def rounds(self):
+        """The work factor of the stored bcrypt hash or ``None`` if no
+        bcrypt hash is stored.
+
+        """
+        if not self.str.startswith(BCryptHasher.prefixes):
+            return None
+        return BCryptHasher.rounds(self.str)
+
+    def needs_rehash(self):
+        """Returns ``True`` if the stored hash was not made by the first
+        hasher in ``IAM_PASSWORD_HASHERS`` or with other parameters,
+        such as a work factor other than ``IAM_BCRYPT_ROUNDS``.
+
+        """
+        if not self.str:
+            return False
+        try:
+            hasher = identify_hasher(self.str)
+        except ValueError:
+            return False
+        return (hasher is not get_default_hasher() or
+                hasher.needs_rehash(self.str))
+
+    def verify(self, other, username=None):
+        """Returns ``True`` if the passwords match and ``False`` if
+        they do not.
+
+        If ``IAM_VERIFY_EXECUTOR`` is enabled the password is hashed by
+        the :class:`~django_auth_iam.verification.VerificationExecutor`,
+        and :data:`~django_auth_iam.verification.OVERLOADED` is returned
+        if the executor rejects the request. ``username`` is used for
+        the executor's per-user limit. Hashes in a format none of the
+        hashers in ``IAM_PASSWORD_HASHERS`` recognizes never match.
+
+        """
+        if not self.str or not other:
+            return False
+        executor = get_verification_executor()
+        if executor is not None:
+            return executor.verify(other, self.str, username)
+        try:
+            hasher = identify_hasher(self.str)
+        except ValueError:
+            return False
+        return hasher.verify(other, self.str)
+
     def __eq__(self, other):
         """Returns ``True`` if the passwords match.
 
@@ -49,16 +108,7 @@ class BCryptPassword(Password):
         is independent of the number of characters that match.
 
         """
-        if not self.str or not other:
-            return False
-        hashed = str(self.str)
-        other = bcrypt.hashpw(other, hashed)
-        if len(hashed) != len(other):
-            return False
-        result = 0
-        for x, y in zip(hashed, other):
-            result |= ord(x) ^ ord(y)
-        return result == 0
+        return self.verify(other) is True
 
     def __ne__(self, other):
         if not self.str:
@@ -0,0 +1,182 @@
+"""
+django_auth_iam.ratelimit
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module limits the rate of failed logins per username and per
+client IP address.
+
+Failed logins are counted in Django's cache, so the limits are shared by
+all processes using the same cache. A login that is over a limit is
+rejected before the user is looked up in SimpleDB and before the
+password is verified, so repeated guessing costs a cache read instead of
+a bcrypt verification.
+
+The counters are sliding windows approximated by two fixed windows: the
+count of the previous window is weighted by the part of it that still
+overlaps the sliding window.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+
+
+IAM_LOGIN_RATE_LIMIT_USERNAME = getattr(settings,
+                                        'IAM_LOGIN_RATE_LIMIT_USERNAME',
+                                        (10, 60))
+IAM_LOGIN_RATE_LIMIT_IP = getattr(settings, 'IAM_LOGIN_RATE_LIMIT_IP',
+                                  (100, 60))
+
+KEY_PREFIX = 'django_auth_iam:ratelimit'
+
+
+class SlidingWindow(object):
+    """Counts events per identifier over the last ``window`` seconds and
+    allows at most ``limit`` of them.
+
+    """
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def keys(self, ident, now):
+        """Returns the cache keys of the counters of ``ident`` for the
+        current and the previous window.
+
+        """
+        if isinstance(ident, unicode):
+            ident = ident.encode('utf8')
+        # Usernames may contain characters memcached does not allow in
+        # keys.
+        digest = hashlib.md5(ident).hexdigest()
+        index = int(now // self.window)
+        return ['{0}:{1}:{2}:{3}'.format(KEY_PREFIX, self.scope, digest, i)
+                for i in (index, index - 1)]
+
+    def count(self, values, ident, now):
+        """Returns the number of events for ``ident`` in ``values``, the
+        counters of :meth:`keys` read from the cache.
+
+        """
+        current, previous = self.keys(ident, now)
+        overlap = 1 - (now % self.window) / float(self.window)
+        return values.get(current, 0) + values.get(previous, 0) * overlap
+
+    def hit(self, ident, now=None):
+        """Count an event for ``ident``."""
+        key = self.keys(ident, now or time.time())[0]
+        # Counters are kept for two windows so that the next window can
+        # weigh them.
+        django_cache.add(key, 0, self.window * 2)
+        try:
+            django_cache.incr(key)
+        except ValueError:
+            # The counter was evicted since it was added.
+            django_cache.add(key, 1, self.window * 2)
+
+    def reset(self, ident, now=None):
+        """Forget the events counted for ``ident``."""
+        django_cache.delete_many(self.keys(ident, now or time.time()))
+
+
+class LoginRateLimiter(object):
+    """Limits failed logins per username and per client IP address.
+
+    ``username_limit`` and ``ip_limit`` are ``(failures, seconds)``
+    tuples or ``None`` for no limit.
+
+    """
+
+    def __init__(self, username_limit=None, ip_limit=None):
+        self.windows = {}
+        if username_limit:
+            self.windows['username'] = SlidingWindow('username',
+                                                     *username_limit)
+        if ip_limit:
+            self.windows['ip'] = SlidingWindow('ip', *ip_limit)
+        self.rejected = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _idents(self, username, ip):
+        idents = {'username': username or '', 'ip': ip}
+        return [(window, idents[scope])
+                for scope, window in sorted(self.windows.iteritems())
+                if idents[scope] is not None]
+
+    def check(self, username, ip=None, now=None):
+        """Returns ``None`` if a login of ``username`` from ``ip`` is
+        allowed, otherwise the scope (``'username'`` or ``'ip'``) whose
+        limit has been reached. Costs a single cache read.
+
+        """
+        now = now or time.time()
+        idents = self._idents(username, ip)
+        keys = []
+        for window, ident in idents:
+            keys.extend(window.keys(ident, now))
+        values = django_cache.get_many(keys) if keys else {}
+        for window, ident in idents:
+            if window.count(values, ident, now) >= window.limit:
+                with self._lock:
+                    self.rejected += 1
+                return window.scope
+        return None
+
+    def failed(self, username, ip=None, now=None):
+        """Count a failed login of ``username`` from ``ip``."""
+        with self._lock:
+            self.failures += 1
+        for window, ident in self._idents(username, ip):
+            window.hit(ident, now)
+
+    def reset(self, username=None, ip=None):
+        """Forget the failed logins counted for ``username`` and
+        ``ip``.
+
+        """
+        for window, ident in self._idents(username, ip):
+            if ident:
+                window.reset(ident)
+
+    def stats(self):
+        """Returns a dictionary with the number of failed logins counted
+        and logins rejected by this process.
+
+        """
+        return {'failures': self.failures, 'rejected': self.rejected}
+
+
+def get_client_ip(request):
+    """Returns the IP address of the client of ``request`` or ``None``."""
+    if request is None:
+        return None
+    return request.META.get('REMOTE_ADDR') or None
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Returns the shared :class:`LoginRateLimiter` or ``None`` if both
+    ``IAM_LOGIN_RATE_LIMIT_USERNAME`` and ``IAM_LOGIN_RATE_LIMIT_IP``
+    are ``None``.
+
+    """
+    global _limiter
+    if not (IAM_LOGIN_RATE_LIMIT_USERNAME or IAM_LOGIN_RATE_LIMIT_IP):
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = LoginRateLimiter(IAM_LOGIN_RATE_LIMIT_USERNAME,
+                                        IAM_LOGIN_RATE_LIMIT_IP)
+        return _limiter
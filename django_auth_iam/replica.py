@@ -0,0 +1,148 @@
+"""
+django_auth_iam.replica
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a local SQLite replica of the users stored in
+SimpleDB.
+
+The replica holds what is needed to log a user in: the username, the
+password hash, the access key and the encrypted secret key. It is kept
+up to date by :meth:`~django_auth_iam.models.User.sync_replica` and by
+the changes made through :class:`~django_auth_iam.models.User` in this
+process. SimpleDB remains the source of truth.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import sqlite3
+import threading
+
+from django.conf import settings
+
+
+IAM_REPLICA_PATH = getattr(settings, 'IAM_REPLICA_PATH', None)
+IAM_REPLICA_SYNC_OVERLAP = getattr(settings, 'IAM_REPLICA_SYNC_OVERLAP', 300)
+
+FIELDS = ('username', 'id', 'password', 'access_key', 'enc_secret_key',
+          'modified')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    password TEXT,
+    access_key TEXT,
+    enc_secret_key TEXT,
+    modified TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+class LocalReplica(object):
+    """A replica of the users in the SQLite database at ``path``.
+
+    Rows are dictionaries with the keys in :data:`FIELDS`. Each thread
+    uses its own connection to the database.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.text_factory = str
+            with self._lock:
+                if not self._ready:
+                    connection.executescript(SCHEMA)
+                    self._ready = True
+            self._local.connection = connection
+        return connection
+
+    def get(self, username):
+        """Returns the row of ``username`` or ``None``."""
+        if isinstance(username, unicode):
+            username = username.encode('utf8')
+        row = self._connection().execute(
+            'SELECT {0} FROM users WHERE username = ?'.format(
+                ', '.join(FIELDS)), (username,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(FIELDS, row))
+
+    def put(self, rows):
+        """Insert or replace ``rows``."""
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO users ({0}) VALUES ({1})'.format(
+                    ', '.join(FIELDS), ', '.join('?' * len(FIELDS))),
+                [tuple(row.get(field) for field in FIELDS) for row in rows])
+
+    def delete(self, usernames):
+        """Remove the rows of ``usernames``."""
+        connection = self._connection()
+        with connection:
+            connection.executemany('DELETE FROM users WHERE username = ?',
+                                   [(name,) for name in usernames])
+
+    def delete_except(self, usernames):
+        """Remove all rows except those of ``usernames``. Returns the
+        number of rows removed.
+
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute('CREATE TEMP TABLE IF NOT EXISTS keep '
+                               '(username TEXT PRIMARY KEY)')
+            connection.execute('DELETE FROM keep')
+            connection.executemany('INSERT OR IGNORE INTO keep VALUES (?)',
+                                   [(name,) for name in usernames])
+            deleted = connection.execute(
+                'DELETE FROM users WHERE username NOT IN '
+                '(SELECT username FROM keep)').rowcount
+            connection.execute('DELETE FROM keep')
+        return deleted
+
+    def get_meta(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        connection = self._connection()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                               (key, value))
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM users').fetchone()[0]
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+def get_replica():
+    """Returns the :class:`LocalReplica` at ``IAM_REPLICA_PATH`` or
+    ``None`` if it is not set.
+
+    """
+    global _replica
+    if not IAM_REPLICA_PATH:
+        return None
+    with _replica_lock:
+        if _replica is None or _replica.path != IAM_REPLICA_PATH:
+            _replica = LocalReplica(IAM_REPLICA_PATH)
+        return _replica
@@ -0,0 +1,260 @@
+"""
+django_auth_iam.resilience
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module makes the calls to IAM, SimpleDB and STS retry transient
+errors and fail fast when a service is down.
+
+Throttling errors, server errors and network errors are retried with
+jittered exponential backoff. Calls that create something in IAM are
+only retried when they were throttled, as a server error does not tell
+whether they succeeded. Each endpoint has a circuit breaker that opens
+after repeated failures, so calls fail right away instead of tying up
+worker threads until their sockets time out. A deadline limits the time
+spent on all calls made within it.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import httplib
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from boto.exception import BotoServerError
+from django.conf import settings
+
+from .instrumentation import InstrumentedConnection, retried
+
+
+IAM_RETRY_ATTEMPTS = getattr(settings, 'IAM_RETRY_ATTEMPTS', 4)
+IAM_RETRY_BASE_DELAY = getattr(settings, 'IAM_RETRY_BASE_DELAY', 0.1)
+IAM_RETRY_MAX_DELAY = getattr(settings, 'IAM_RETRY_MAX_DELAY', 2.0)
+IAM_CIRCUIT_BREAKER_THRESHOLD = getattr(settings,
+                                        'IAM_CIRCUIT_BREAKER_THRESHOLD', 5)
+IAM_CIRCUIT_BREAKER_TIMEOUT = getattr(settings, 'IAM_CIRCUIT_BREAKER_TIMEOUT',
+                                      30)
+IAM_SOCKET_TIMEOUT = getattr(settings, 'IAM_SOCKET_TIMEOUT', 10)
+
+THROTTLING_CODES = frozenset(['Throttling', 'ThrottlingException',
+                              'RequestLimitExceeded', 'SlowDown',
+                              'TooManyRequestsException'])
+
+NON_IDEMPOTENT = frozenset(['create_user', 'create_access_key',
+                            'create_group', 'create_domain'])
+"""Operations that are only retried when they were throttled."""
+
+NETWORK_ERRORS = (socket.error, httplib.HTTPException)
+
+
+class CircuitOpenError(BotoServerError):
+    """Raised instead of calling an endpoint whose circuit breaker is
+    open.
+
+    """
+
+    def __init__(self, endpoint):
+        BotoServerError.__init__(self, 503, 'Circuit breaker open for {0}'
+                                 .format(endpoint))
+        self.endpoint = endpoint
+
+
+class DeadlineExceeded(BotoServerError):
+    """Raised when a call is attempted after the current deadline."""
+
+    def __init__(self):
+        BotoServerError.__init__(self, 504, 'Deadline exceeded')
+
+
+def is_throttling(error):
+    return (isinstance(error, BotoServerError) and
+            (error.status == 429 or error.error_code in THROTTLING_CODES))
+
+
+def is_transient(error):
+    """Returns ``True`` if ``error`` may go away when the call is
+    retried.
+
+    """
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if isinstance(error, NETWORK_ERRORS):
+        return True
+    return is_throttling(error) or (isinstance(error, BotoServerError) and
+                                    error.status >= 500)
+
+
+class CircuitBreaker(object):
+    """Tracks the failures of an endpoint.
+
+    After ``threshold`` consecutive failures the breaker opens and
+    :meth:`allow` returns ``False`` for ``timeout`` seconds. Then a
+    single trial call is allowed; the breaker closes if it succeeds and
+    opens again if it fails.
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=None, timeout=None):
+        self.threshold = threshold or IAM_CIRCUIT_BREAKER_THRESHOLD
+        self.timeout = timeout if timeout is not None \
+            else IAM_CIRCUIT_BREAKER_TIMEOUT
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns ``True`` if a call may be made."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    time.time() - self.opened_at >= self.timeout):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.threshold):
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(endpoint):
+    """Returns the :class:`CircuitBreaker` of ``endpoint``."""
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker()
+        return breaker
+
+
+def breaker_states():
+    """Returns a dictionary mapping each endpoint to the state of its
+    circuit breaker.
+
+    """
+    with _breakers_lock:
+        return dict((endpoint, breaker.state)
+                    for endpoint, breaker in _breakers.iteritems())
+
+
+def reset_breakers():
+    """Close all circuit breakers."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+_local = threading.local()
+
+@contextmanager
+def deadline(seconds):
+    """Limit the calls made in the ``with`` block to ``seconds`` in
+    total. Calls made after the deadline raise :exc:`DeadlineExceeded`
+    and retries that would end after it are not made. Nested deadlines
+    cannot extend an outer one.
+
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = time.time() + seconds
+    if previous is not None:
+        _local.deadline = min(previous, _local.deadline)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """Returns the seconds left until the current deadline or ``None``
+    if there is no deadline.
+
+    """
+    current = getattr(_local, 'deadline', None)
+    if current is None:
+        return None
+    return current - time.time()
+
+
+def backoff(attempt):
+    """Returns the delay before retry number ``attempt``, chosen at
+    random up to an exponentially growing limit.
+
+    """
+    return random.uniform(0, min(IAM_RETRY_MAX_DELAY,
+                                 IAM_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class ResilientConnection(InstrumentedConnection):
+    """An :class:`~django_auth_iam.instrumentation.InstrumentedConnection`
+    that retries transient errors, honours the current :func:`deadline`
+    and goes through the circuit breaker of its endpoint.
+
+    The retries of :mod:`boto` itself are disabled, as they back off
+    for up to a minute.
+
+    """
+
+    def __init__(self, connection, service):
+        super(ResilientConnection, self).__init__(connection, service)
+        host = getattr(connection, 'host', None)
+        self._endpoint = '{0}:{1}'.format(service, host) if host else service
+        if hasattr(connection, 'num_retries'):
+            connection.num_retries = 0
+        kwargs = getattr(connection, 'http_connection_kwargs', None)
+        if kwargs is not None and IAM_SOCKET_TIMEOUT:
+            kwargs['timeout'] = IAM_SOCKET_TIMEOUT
+
+    def _invoke(self, operation, func, args, kwargs):
+        breaker = get_breaker(self._endpoint)
+        attempt = 0
+        while True:
+            left = remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded()
+            if not breaker.allow():
+                raise CircuitOpenError(self._endpoint)
+            try:
+                result = super(ResilientConnection, self)._invoke(
+                    operation, func, args, kwargs)
+            except Exception as e:
+                if not is_transient(e) or is_throttling(e):
+                    # The endpoint answered, so it is up.
+                    breaker.success()
+                else:
+                    breaker.failure()
+                if not is_transient(e):
+                    raise
+                attempt += 1
+                if (attempt >= IAM_RETRY_ATTEMPTS or
+                        (operation in NON_IDEMPOTENT and
+                         not is_throttling(e))):
+                    raise
+                delay = backoff(attempt)
+                left = remaining()
+                if left is not None and delay >= left:
+                    raise
+                retried(self._service, operation, attempt)
+                time.sleep(delay)
+            else:
+                breaker.success()
+                return result
@@ -0,0 +1,179 @@
+"""
+django_auth_iam.session
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module keeps the AWS credentials of a logged in user in the
+session, encrypted with a server key.
+
+The credentials are stored when the user logs in. On later requests
+:class:`SessionCredentialsMiddleware` gives ``request.user`` an
+``aws_credentials`` attribute that is decrypted from the session the
+first time it is used, so a request costs one symmetric decryption
+instead of a SimpleDB lookup and a bcrypt verification.
+
+Temporary credentials from STS cannot be issued again without the
+user's password, so they are only restored from the session until they
+expire. The user then has no ``aws_credentials`` until logging in again.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.signals import user_logged_in
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .credentials import LazyCredentials
+from .sts import IAM_STS_MIN_TTL
+from .utils import KeyCipher
+
+import logging
+logger = logging.getLogger('django_auth_iam')
+
+
+IAM_SESSION_CREDENTIALS = getattr(settings, 'IAM_SESSION_CREDENTIALS', False)
+IAM_SESSION_KEY = getattr(settings, 'IAM_SESSION_KEY', None)
+
+SESSION_KEY = '_iam_credentials'
+EXPIRATION_KEY = '_iam_credentials_expiration'
+
+
+class CredentialSealer(object):
+    """Encrypts and authenticates credentials with a server key.
+
+    A sealed value is the HMAC of the cipher text followed by the cipher
+    text. :meth:`open` returns ``None`` for values that have been
+    tampered with or were sealed with another key.
+
+    """
+
+    def __init__(self, key=None):
+        if key is None:
+            key = IAM_SESSION_KEY or settings.SECRET_KEY
+        self._key = key
+        self._cipher = KeyCipher('django_auth_iam.session.encrypt:' + key,
+                                 random_iv=True)
+
+    def _mac(self, value):
+        return salted_hmac('django_auth_iam.session.mac', value,
+                           self._key).hexdigest()
+
+    def seal(self, credentials):
+        """Returns the tuple of strings ``credentials`` sealed."""
+        value = self._cipher.encrypt('\n'.join(credentials)).replace('\n', '')
+        return '{0}${1}'.format(self._mac(value), value)
+
+    def open(self, sealed):
+        """Returns the credentials tuple from ``sealed`` or ``None``."""
+        mac, sep, value = sealed.partition('$')
+        if not sep or not constant_time_compare(mac, self._mac(value)):
+            return None
+        return tuple(self._cipher.decrypt(value).split('\n'))
+
+
+_sealer = None
+
+def get_sealer():
+    """Returns the :class:`CredentialSealer` for ``IAM_SESSION_KEY``."""
+    global _sealer
+    if _sealer is None:
+        _sealer = CredentialSealer()
+    return _sealer
+
+
+def store_credentials(session, credentials, expiration=None):
+    """Store ``credentials`` sealed in ``session``. ``expiration`` is the
+    expiration of temporary credentials in seconds since the epoch.
+
+    """
+    session[SESSION_KEY] = get_sealer().seal(credentials)
+    if expiration is not None:
+        session[EXPIRATION_KEY] = expiration
+    else:
+        session.pop(EXPIRATION_KEY, None)
+
+
+def has_credentials(session, now=None):
+    """Returns ``True`` if ``session`` holds credentials that have not
+    expired. Expired credentials are removed from ``session``.
+
+    """
+    if SESSION_KEY not in session:
+        return False
+    expiration = session.get(EXPIRATION_KEY)
+    if (expiration is not None and
+            expiration - (now or time.time()) <= IAM_STS_MIN_TTL):
+        logger.info('The temporary credentials in the session have expired')
+        del session[SESSION_KEY]
+        del session[EXPIRATION_KEY]
+        return False
+    return True
+
+
+def load_credentials(session):
+    """Returns the credentials stored in ``session`` or ``None`` if
+    there are none or they have expired.
+
+    """
+    if not has_credentials(session):
+        return None
+    return get_sealer().open(session[SESSION_KEY])
+
+
+class SessionCredentials(LazyCredentials):
+    """The credentials stored in a session, decrypted on first use."""
+
+    __slots__ = ()
+
+    def __init__(self, session):
+        super(SessionCredentials, self).__init__(
+            lambda: load_credentials(session) or ())
+
+
+def get_user(request):
+    """Like :func:`django.contrib.auth.get_user`, but gives the user an
+    ``aws_credentials`` attribute if credentials are stored in the
+    session.
+
+    """
+    user = auth.get_user(request)
+    if user.is_authenticated() and has_credentials(request.session):
+        user.aws_credentials = SessionCredentials(request.session)
+    return user
+
+
+class LazyUser(object):
+    def __get__(self, request, obj_type=None):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = get_user(request)
+        return request._cached_user
+
+
+class SessionCredentialsMiddleware(object):
+    """Restores ``request.user.aws_credentials`` from the session.
+
+    Must be placed after
+    :class:`django.contrib.auth.middleware.AuthenticationMiddleware`.
+
+    """
+
+    def process_request(self, request):
+        assert hasattr(request, 'session'), (
+            'The SessionCredentialsMiddleware requires session middleware '
+            'to be installed.')
+        request.__class__.user = LazyUser()
+        return None
+
+
+def _store_on_login(sender, request, user, **kwargs):
+    credentials = getattr(user, 'aws_credentials', None)
+    if IAM_SESSION_CREDENTIALS and credentials:
+        store_credentials(request.session, credentials,
+                          getattr(credentials, 'expiration', None))
+
+user_logged_in.connect(_store_on_login,
+                       dispatch_uid='django_auth_iam.session.store_on_login')
@@ -0,0 +1,211 @@
+"""
+django_auth_iam.sts
+~~~~~~~~~~~~~~~~~~~~
+
+This module hands out temporary credentials from the AWS Security Token
+Service instead of the long-lived access keys of the users.
+
+The temporary credentials are requested with the user's own access key,
+either with ``GetFederationToken`` or with ``AssumeRole``, and cached
+per user. Credentials that are close to expiring are refreshed in the
+background while the cached ones are still handed out, so a login only
+waits for STS when there are no usable credentials at all.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import calendar
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import connections
+from .cache import LRUCache
+
+import logging
+logger = logging.getLogger('django_auth_iam')
+
+
+IAM_STS_MODE = getattr(settings, 'IAM_STS_MODE', None)
+IAM_STS_ROLE_ARN = getattr(settings, 'IAM_STS_ROLE_ARN', None)
+IAM_STS_POLICY = getattr(settings, 'IAM_STS_POLICY', None)
+IAM_STS_DURATION = getattr(settings, 'IAM_STS_DURATION', 3600)
+IAM_STS_REFRESH_MARGIN = getattr(settings, 'IAM_STS_REFRESH_MARGIN', 600)
+IAM_STS_MIN_TTL = getattr(settings, 'IAM_STS_MIN_TTL', 60)
+IAM_STS_CACHE_SIZE = getattr(settings, 'IAM_STS_CACHE_SIZE', 10000)
+IAM_STS_REFRESH_POOL_SIZE = getattr(settings, 'IAM_STS_REFRESH_POOL_SIZE', 4)
+
+MODES = ('federation', 'assume_role')
+
+
+def parse_expiration(value):
+    """Returns the ISO 8601 timestamp ``value`` returned by STS as
+    seconds since the epoch.
+
+    """
+    value = value.split('.')[0].rstrip('Z')
+    return calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%S'))
+
+
+class TemporaryCredentials(object):
+    """Temporary credentials issued by STS.
+
+    Iterating yields the access key, the secret key and the session
+    token. :attr:`expiration` is in seconds since the epoch.
+
+    """
+
+    __slots__ = ('access_key', 'secret_key', 'session_token', 'expiration')
+
+    def __init__(self, access_key, secret_key, session_token, expiration):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.expiration = expiration
+
+    def ttl(self, now=None):
+        """Returns the number of seconds until the credentials expire."""
+        return self.expiration - (now or time.time())
+
+    def __iter__(self):
+        return iter((self.access_key, self.secret_key, self.session_token))
+
+    def __repr__(self):
+        return '<TemporaryCredentials {0} expires {1}>'.format(
+            self.access_key, self.expiration)
+
+
+class STSCredentialProvider(object):
+    """Issues and caches temporary credentials for users.
+
+    ``mode`` is ``'federation'`` to call ``GetFederationToken`` or
+    ``'assume_role'`` to assume the role ``role_arn``. Cached
+    credentials are refreshed in the background once they expire within
+    ``refresh_margin`` seconds, and are no longer handed out when they
+    expire within ``min_ttl`` seconds.
+
+    """
+
+    def __init__(self, mode=None, role_arn=None, policy=None, duration=None,
+                 refresh_margin=None, min_ttl=None, max_size=None,
+                 pool_size=None):
+        if mode is None:
+            mode = IAM_STS_MODE
+        if mode not in MODES:
+            raise ImproperlyConfigured('IAM_STS_MODE must be one of {0}'
+                                       .format(', '.join(MODES)))
+        if role_arn is None:
+            role_arn = IAM_STS_ROLE_ARN
+        if mode == 'assume_role' and not role_arn:
+            raise ImproperlyConfigured('IAM_STS_ROLE_ARN is required with '
+                                       'IAM_STS_MODE "assume_role"')
+        self.mode = mode
+        self.role_arn = role_arn
+        self.policy = policy if policy is not None else IAM_STS_POLICY
+        self.duration = duration or IAM_STS_DURATION
+        self.refresh_margin = (refresh_margin if refresh_margin is not None
+                               else IAM_STS_REFRESH_MARGIN)
+        self.min_ttl = min_ttl if min_ttl is not None else IAM_STS_MIN_TTL
+        self.pool_size = pool_size or IAM_STS_REFRESH_POOL_SIZE
+        self._cache = LRUCache(max_size or IAM_STS_CACHE_SIZE)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pool = None
+        self.issued = 0
+        self.hits = 0
+        self.refreshes = 0
+
+    def get(self, username, keys):
+        """Returns usable temporary credentials for ``username``.
+
+        ``keys`` is called to get the user's ``(access_key, secret_key)``
+        only when new credentials have to be issued.
+
+        """
+        credentials = self._cache.get(username)
+        now = time.time()
+        if credentials is not None and credentials.ttl(now) > self.min_ttl:
+            self.hits += 1
+            if credentials.ttl(now) <= self.refresh_margin:
+                self._refresh_later(username, keys)
+            return credentials
+        return self._issue(username, keys)
+
+    def invalidate(self, username):
+        """Forget the credentials cached for ``username``."""
+        self._cache.delete(username)
+
+    def stats(self):
+        """Returns a dictionary with the number of credentials issued,
+        cache hits and background refreshes.
+
+        """
+        return {'issued': self.issued, 'hits': self.hits,
+                'refreshes': self.refreshes, 'size': len(self._cache)}
+
+    def _issue(self, username, keys):
+        access_key, secret_key = tuple(keys())[:2]
+        sts = connections.connect_sts(access_key, secret_key)
+        # Federated user and role session names are limited to 32 and
+        # 64 characters.
+        if self.mode == 'assume_role':
+            response = sts.assume_role(self.role_arn, username[:64],
+                                       policy=self.policy,
+                                       duration_seconds=self.duration)
+        else:
+            response = sts.get_federation_token(username[:32],
+                                                duration=self.duration,
+                                                policy=self.policy)
+        c = response.credentials
+        credentials = TemporaryCredentials(c.access_key, c.secret_key,
+                                           c.session_token,
+                                           parse_expiration(c.expiration))
+        self._cache.set(username, credentials)
+        self.issued += 1
+        return credentials
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.pool_size)
+            return self._pool
+
+    def _refresh_later(self, username, keys):
+        with self._lock:
+            if username in self._refreshing:
+                return
+            self._refreshing.add(username)
+        self._get_pool().apply_async(self._refresh, (username, keys))
+
+    def _refresh(self, username, keys):
+        try:
+            self._issue(username, keys)
+            self.refreshes += 1
+        except Exception:
+            logger.exception('Refreshing the temporary credentials of user '
+                             '`{0}` FAILED'.format(username))
+        finally:
+            with self._lock:
+                self._refreshing.discard(username)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_sts_provider():
+    """Returns the shared :class:`STSCredentialProvider` or ``None`` if
+    ``IAM_STS_MODE`` is not set.
+
+    """
+    global _provider
+    if not IAM_STS_MODE:
+        return None
+    with _provider_lock:
+        if _provider is None:
+            _provider = STSCredentialProvider()
+        return _provider
@@ -10,22 +10,204 @@ This module provides utility functions.
 
 """
 
+import base64
 import hashlib
+import os
 from Crypto.Cipher import AES
+from Crypto.Util.strxor import strxor
+from django.utils.importlib import import_module
+from django.core.exceptions import ImproperlyConfigured
+
+
+def import_class(path, setting):
+    """Import and return the class named by the dotted ``path``.
+
+    Raises :exc:`~django.core.exceptions.ImproperlyConfigured` if the
+    class cannot be found. ``setting`` is the name of the setting the
+    path came from and is only used in error messages.
+
+    """
+    module, sep, attr = path.rpartition('.')
+    try:
+        mod = import_module(module)
+    except ImportError, e:
+        raise ImproperlyConfigured('Error importing class module '
+                                   '{0}: "{1}"'.format(module, e))
+    except ValueError, e:
+        raise ImproperlyConfigured('Error importing class module. '
+                                   'Is {0} a string?'.format(setting))
+    try:
+        cls = getattr(mod, attr)
+    except AttributeError:
+        raise ImproperlyConfigured('Module "{0}" does not define a '
+                                   '"{1}" class'.format(module, attr))
+    return cls
+
+
+BLOCK_SIZE = 16
+IV = '\0' * BLOCK_SIZE
+
+
+class KeyCipher(object):
+    """Encrypts and decrypts secret keys with a password.
+
+    The encryption key is derived from the password once, so a single
+    instance can be used for any number of keys. The output is the same
+    as that of :func:`encrypt_key`, unless ``random_iv`` is ``True``.
+    In that case every cipher text gets a random initialization vector,
+    which is stored in front of it.
+
+    """
+
+    def __init__(self, password, random_iv=False):
+        self._key = hashlib.sha256(password).digest()
+        self.random_iv = random_iv
+
+    def encrypt(self, plain):
+        """Encrypt ``plain`` and return it base64 encoded."""
+        if isinstance(plain, unicode):
+            raise ValueError('unicode string is not allowed')
+        plain += ' ' * (BLOCK_SIZE - len(plain) % BLOCK_SIZE)
+        iv = os.urandom(BLOCK_SIZE) if self.random_iv else IV
+        encryptor = AES.new(self._key, AES.MODE_CBC, iv)
+        cipher = encryptor.encrypt(plain)
+        if self.random_iv:
+            cipher = iv + cipher
+        return base64.encodestring(cipher)
+
+    def _split(self, cipher):
+        cipher = base64.decodestring(cipher)
+        if self.random_iv:
+            return cipher[:BLOCK_SIZE], cipher[BLOCK_SIZE:]
+        return IV, cipher
+
+    def decrypt(self, cipher):
+        """Decrypt the base64 encoded ``cipher``."""
+        iv, cipher = self._split(cipher)
+        decryptor = AES.new(self._key, AES.MODE_CBC, iv)
+        return decryptor.decrypt(cipher).rstrip(' ')
+
+    def encrypt_many(self, plains):
+        """Encrypt each of ``plains``. Returns a list of ciphers."""
+        return [self.encrypt(plain) for plain in plains]
+
+    def decrypt_many(self, ciphers):
+        """Decrypt each of ``ciphers``. Returns a list of plain texts.
+
+        All the ciphers are decrypted by a single AES call. CBC mode
+        decrypts a block by XORing it with the previous cipher block, so
+        the cipher texts, each shifted by one block, are XORed onto the
+        result in a single call as well.
+
+        """
+        ciphers = [self._split(cipher) for cipher in ciphers]
+        if not ciphers:
+            return []
+        data = ''.join(cipher for iv, cipher in ciphers)
+        previous = ''.join(iv + cipher[:-BLOCK_SIZE] for iv, cipher in ciphers)
+        decryptor = AES.new(self._key, AES.MODE_ECB)
+        plain = memoryview(strxor(decryptor.decrypt(data), previous))
+        result = []
+        offset = 0
+        for iv, cipher in ciphers:
+            end = offset + len(cipher)
+            result.append(plain[offset:end].tobytes().rstrip(' '))
+            offset = end
+        return result
 
 
 def encrypt_key(plain, password):
-    if isinstance(plain, unicode):
-        raise ValueError('unicode string is not allowed')
-    encryption_key = hashlib.sha256(password).digest()
-    encryptor = AES.new(encryption_key, AES.MODE_CBC)
-    plain += ' ' * (16 - len(plain) % 16)
-    cipher = encryptor.encrypt(plain)
-    return cipher.encode('base64')
+    return KeyCipher(password).encrypt(plain)
 
 def decrypt_key(cipher, password):
-    cipher = cipher.decode('base64')
-    encryption_key = hashlib.sha256(password).digest()
-    decryptor = AES.new(encryption_key, AES.MODE_CBC)
-    plain = decryptor.decrypt(cipher).rstrip(' ')
-    return plain
+    # ``password`` may also be a KeyCipher, which holds the derived key
+    # instead of the password.
+    if not isinstance(password, KeyCipher):
+        password = KeyCipher(password)
+    return password.decrypt(cipher)
+
+
+class MasterKeyring(object):
+    """Wraps encrypted secret keys in a second layer of encryption with
+    a server-side master key.
+
+    ``keys`` is a sequence of master keys. New values are wrapped with
+    the first key; the other keys are only used to unwrap values that
+    were wrapped before the keys were rotated. If ``keys`` is empty,
+    values are stored as they are.
+
+    """
+
+    PREFIX = '$m1$'
+
+    def __init__(self, keys):
+        self._ciphers = [(self.key_id(key), KeyCipher(key, random_iv=True))
+                         for key in keys]
+
+    @staticmethod
+    def key_id(key):
+        """Returns the identifier stored with values wrapped by ``key``."""
+        return hashlib.sha256('django_auth_iam:' + key).hexdigest()[:8]
+
+    @property
+    def current_id(self):
+        if not self._ciphers:
+            return None
+        return self._ciphers[0][0]
+
+    def _cipher(self, key_id):
+        for id, cipher in self._ciphers:
+            if id == key_id:
+                return cipher
+        raise ValueError('no master key with the id "{0}"'.format(key_id))
+
+    def _parse(self, value):
+        if not value.startswith(self.PREFIX):
+            return None, value
+        key_id, sep, wrapped = value[len(self.PREFIX):].partition('$')
+        return key_id, wrapped
+
+    def wrap(self, value):
+        """Wrap ``value`` with the current master key."""
+        if not self._ciphers:
+            return value
+        key_id, cipher = self._ciphers[0]
+        return '{0}{1}${2}'.format(self.PREFIX, key_id,
+                                   cipher.encrypt(value).replace('\n', ''))
+
+    def unwrap(self, value):
+        """Returns ``value`` with the master key encryption removed."""
+        key_id, wrapped = self._parse(value)
+        if key_id is None:
+            return value
+        return self._cipher(key_id).decrypt(wrapped)
+
+    def needs_rewrap(self, value):
+        """Returns ``True`` if ``value`` is not wrapped with the current
+        master key.
+
+        """
+        return self._parse(value)[0] != self.current_id
+
+    def rewrap_many(self, values):
+        """Unwrap each of ``values`` and wrap it again with the current
+        master key. Values are grouped by master key so that each group
+        is decrypted in a single pass.
+
+        """
+        groups = {}
+        for i, value in enumerate(values):
+            key_id, wrapped = self._parse(value)
+            groups.setdefault(key_id, []).append((i, wrapped))
+        result = list(values)
+        for key_id, group in groups.iteritems():
+            if key_id == self.current_id:
+                continue
+            if key_id is None:
+                plains = [wrapped for i, wrapped in group]
+            else:
+                plains = self._cipher(key_id).decrypt_many(
+                    [wrapped for i, wrapped in group])
+            for (i, wrapped), plain in zip(group, plains):
+                result[i] = self.wrap(plain)
+        return result
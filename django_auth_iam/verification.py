@@ -0,0 +1,170 @@
+"""
+django_auth_iam.verification
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides an executor that verifies passwords in a pool of
+worker processes.
+
+Verifying a password with bcrypt, or another slow hasher, takes a lot
+of CPU time. Running it in worker processes keeps the request threads
+responsive, and the admission control makes a burst of login attempts
+fail fast instead of queueing up behind each other.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .hashers import identify_hasher
+
+
+IAM_VERIFY_EXECUTOR = getattr(settings, 'IAM_VERIFY_EXECUTOR', False)
+IAM_VERIFY_PROCESSES = getattr(settings, 'IAM_VERIFY_PROCESSES', None)
+IAM_VERIFY_QUEUE_SIZE = getattr(settings, 'IAM_VERIFY_QUEUE_SIZE', 100)
+IAM_VERIFY_PER_USER_LIMIT = getattr(settings, 'IAM_VERIFY_PER_USER_LIMIT', 2)
+
+
+OVERLOADED = 'overloaded'
+"""Returned instead of ``True`` or ``False`` when a verification was
+rejected because the executor is overloaded.
+
+"""
+
+
+def _verify(password, encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.verify(password, encoded)
+
+
+class VerificationExecutor(object):
+    """Runs password hashing in a pool of ``processes`` worker processes.
+
+    At most ``queue_size`` verifications may be pending at a time and
+    at most ``per_user_limit`` of them for the same username, if a
+    username is given. Requests beyond those limits are rejected right
+    away with :data:`OVERLOADED`.
+
+    """
+
+    def __init__(self, processes=None, queue_size=None, per_user_limit=None):
+        if processes is None:
+            processes = IAM_VERIFY_PROCESSES or multiprocessing.cpu_count()
+        if queue_size is None:
+            queue_size = IAM_VERIFY_QUEUE_SIZE
+        if per_user_limit is None:
+            per_user_limit = IAM_VERIFY_PER_USER_LIMIT
+        self.processes = processes
+        self.queue_size = queue_size
+        self.per_user_limit = per_user_limit
+        self.pending = 0
+        self.verified = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._per_user = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _get_pool(self):
+        # A pool inherited from a parent process cannot be used, so a new
+        # one is created after a fork.
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = multiprocessing.Pool(self.processes)
+                self._pid = os.getpid()
+            return self._pool
+
+    def start(self):
+        """Start the worker processes, if they are not running yet in
+        this process. They are otherwise started by the first
+        verification.
+
+        """
+        self._get_pool()
+
+    def _admit(self, username):
+        with self._lock:
+            if (self.pending >= self.queue_size or
+                    (username is not None and self._per_user.get(username, 0)
+                     >= self.per_user_limit)):
+                self.rejected += 1
+                return False
+            self.pending += 1
+            self._per_user[username] = self._per_user.get(username, 0) + 1
+            return True
+
+    def _release(self, username, elapsed):
+        with self._lock:
+            self.pending -= 1
+            count = self._per_user.pop(username) - 1
+            if count:
+                self._per_user[username] = count
+            self.verified += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def _run(self, func, args, username):
+        if not self._admit(username):
+            return OVERLOADED
+        start = time.time()
+        try:
+            return self._get_pool().apply(func, args)
+        finally:
+            self._release(username, time.time() - start)
+
+    def verify(self, password, encoded, username=None):
+        """Verify ``password`` against the hash ``encoded`` in a worker
+        process with the hasher that made it. Returns ``True``,
+        ``False`` or :data:`OVERLOADED` if the request was rejected.
+
+        """
+        return self._run(_verify, (password, encoded), username)
+
+    def stats(self):
+        """Returns a dictionary with the current queue depth, the number
+        of verified and rejected requests and the average and maximum
+        verification latency in seconds.
+
+        """
+        with self._lock:
+            return {'queue_depth': self.pending,
+                    'verified': self.verified,
+                    'rejected': self.rejected,
+                    'latency_avg': (self.total_time / self.verified
+                                    if self.verified else 0.0),
+                    'latency_max': self.max_time}
+
+    def close(self):
+        """Terminate the worker processes."""
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.terminate()
+            self._pool = None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_verification_executor():
+    """Returns the shared :class:`VerificationExecutor` or ``None`` if
+    ``IAM_VERIFY_EXECUTOR`` is disabled.
+
+    """
+    global _executor
+    if not IAM_VERIFY_EXECUTOR:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = VerificationExecutor()
+        return _executor
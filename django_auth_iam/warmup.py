@@ -0,0 +1,135 @@
+"""
+django_auth_iam.warmup
+~~~~~~~~~~~~~~~~~~~~~~~
+
+This module prepares a freshly started worker process for logins.
+
+Without a warm-up the first logins in a new worker import boto,
+PyCrypto and bcrypt, set up the caches and the hashers, and open the
+connection to SimpleDB. :func:`warm_up` does all of that up front and
+reports how long each step took. Call it when a worker starts, for
+example from the WSGI script or from gunicorn's ``post_fork`` hook.
+
+:copyright: (c) 2011  ViewWorld ApS
+:license: GPLv3, see LICENSE for details.
+
+"""
+
+import socket
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from boto.exception import BotoServerError
+from django.conf import settings
+
+import logging
+logger = logging.getLogger('django_auth_iam')
+
+
+IAM_WARM_UP_PRELOAD = getattr(settings, 'IAM_WARM_UP_PRELOAD', 0)
+
+
+@contextmanager
+def _step(timings, name):
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[name] = time.time() - start
+
+
+def warm_up(preload=None):
+    """Prepare this process for logins. Returns an ordered dictionary
+    mapping each step to the seconds it took.
+
+    The steps are:
+
+    ``imports``
+        Import boto, PyCrypto, bcrypt and the backend, and resolve
+        ``IAM_USER_CLASS``.
+    ``settings``
+        Set up the password hashers, the caches, the STS provider, the
+        local replica and the verification executor. Invalid settings
+        raise :exc:`~django.core.exceptions.ImproperlyConfigured`.
+    ``connections``
+        Open the pooled SimpleDB connection of this thread with one
+        request, and create its IAM connection.
+    ``preload``
+        Put the first ``preload`` users, ``IAM_WARM_UP_PRELOAD`` by
+        default, in :data:`~django_auth_iam.models.user_index` and cache
+        the primary keys of their local users, creating the local users
+        that do not exist yet.
+
+    Failures to reach AWS are logged instead of raised, so a worker
+    still starts while AWS is unreachable.
+
+    """
+    if preload is None:
+        preload = IAM_WARM_UP_PRELOAD
+    timings = OrderedDict()
+    start = time.time()
+
+    with _step(timings, 'imports'):
+        # Imported for their import time only.
+        import bcrypt
+        import boto.iam
+        import boto.sdb
+        from Crypto.Cipher import AES
+        from . import connections, models
+        from .backends import AmazonIAMBackend
+        user_class = AmazonIAMBackend().user_class
+
+    with _step(timings, 'settings'):
+        from .cache import get_credential_cache
+        from .hashers import get_hashers
+        from .localusers import get_local_user_resolver
+        from .ratelimit import get_rate_limiter
+        from .replica import get_replica
+        from .sts import get_sts_provider
+        from .verification import get_verification_executor
+        get_hashers()
+        get_credential_cache()
+        get_local_user_resolver()
+        get_rate_limiter()
+        get_sts_provider()
+        replica = get_replica()
+        if replica is not None:
+            len(replica)
+        executor = get_verification_executor()
+        if executor is not None:
+            executor.start()
+
+    with _step(timings, 'connections'):
+        try:
+            connections.get_iam()
+            user_class._manager.domain.get_attributes('warm-up')
+        except (BotoServerError, socket.error) as e:
+            logger.warning('Warm-up could not reach SimpleDB: {0}'.format(e))
+
+    if preload:
+        with _step(timings, 'preload'):
+            try:
+                _preload(user_class, preload)
+            except (BotoServerError, socket.error) as e:
+                logger.warning('Warm-up could not preload users: {0}'
+                               .format(e))
+
+    timings['total'] = time.time() - start
+    logger.info('Warm-up took {0:.3f} seconds ({1})'.format(
+        timings['total'], ', '.join('{0} {1:.3f}'.format(name, seconds)
+                                    for name, seconds in timings.items()
+                                    if name != 'total')))
+    return timings
+
+
+def _preload(user_class, count):
+    from .localusers import get_local_user_resolver
+    from .models import user_index
+    usernames = []
+    for user in user_class.iter_all(min(count, 2500), ['username']):
+        user_index.set(user['username'], user['id'])
+        usernames.append(user['username'])
+        if len(usernames) >= count:
+            break
+    get_local_user_resolver().get_pks(usernames)
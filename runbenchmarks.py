@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Benchmarks for the authentication backend, the models and the
+crypto utilities.
+
+The benchmarks run against the in-memory IAM and SimpleDB services
+from :mod:`django_auth_iam.fake`. Use ``--latency`` to add a delay to
+every simulated AWS call.
+
+"""
+import gc
+import time
+from optparse import OptionParser
+
+from django.conf import settings
+
+parser = OptionParser(usage='%prog [options] [benchmark ...]')
+parser.add_option('--latency', type='float', default=0.0,
+                  help='seconds added to every fake AWS call')
+parser.add_option('--iterations', type='int', default=200,
+                  help='number of timed iterations per benchmark')
+parser.add_option('--rounds', type='int', default=4,
+                  help='bcrypt work factor')
+options, args = parser.parse_args()
+
+if not settings.configured:
+    settings.configure(
+        DATABASE_ENGINE='sqlite3',
+        DATABASE_NAME=':memory:',
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'django_auth_iam',
+        ],
+        IAM_CONNECTION_FACTORY='django_auth_iam.fake',
+        IAM_FAKE_LATENCY=options.latency,
+        IAM_BCRYPT_ROUNDS=options.rounds,
+        IAM_CREDENTIAL_CACHE='django_auth_iam.cache.LocalCredentialCache',
+    )
+
+from django.core.management import call_command
+
+from django_auth_iam import fake, hashers, utils
+from django_auth_iam.backends import AmazonIAMBackend
+from django_auth_iam.cache import get_credential_cache
+from django_auth_iam.models import User, user_index
+
+
+def measure(func, iterations):
+    """Run ``func`` ``iterations`` times. Returns the sorted run times
+    and the average number of objects per run left allocated.
+
+    """
+    func()
+    times = []
+    gc.collect()
+    gc.disable()
+    objects = len(gc.get_objects())
+    try:
+        for i in xrange(iterations):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+        allocated = len(gc.get_objects()) - objects
+    finally:
+        gc.enable()
+    times.sort()
+    return times, float(allocated) / iterations
+
+
+def report(name, times, allocated):
+    total = sum(times)
+    p50 = times[len(times) // 2]
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    print '{0:<28} {1:>10.1f} {2:>10.3f} {3:>10.3f} {4:>10.1f}'.format(
+        name, len(times) / total if total else float('inf'),
+        p50 * 1000, p99 * 1000, allocated)
+
+
+def setup():
+    fake.store.reset()
+    user_index.clear()
+    User.create('bench', 'password')
+
+
+def bench_authenticate():
+    backend = AmazonIAMBackend()
+    cache = get_credential_cache()
+    def run():
+        cache.invalidate('bench')
+        backend.authenticate('bench', 'password')
+    return run
+
+
+def bench_authenticate_cached():
+    backend = AmazonIAMBackend()
+    return lambda: backend.authenticate('bench', 'password')
+
+
+def bench_get_by_username():
+    def run():
+        user_index.clear()
+        User.get_by_username('bench')
+    return run
+
+
+def bench_get_by_username_indexed():
+    return lambda: User.get_by_username('bench')
+
+
+def bench_create():
+    counter = [0]
+    def run():
+        counter[0] += 1
+        User.create('user{0}'.format(counter[0]), 'password')
+    return run
+
+
+def bench_encrypt_key():
+    return lambda: utils.encrypt_key('x' * 40, 'password')
+
+
+def bench_decrypt_key():
+    enc_key = utils.encrypt_key('x' * 40, 'password')
+    return lambda: utils.decrypt_key(enc_key, 'password')
+
+
+def bench_decrypt_many_100():
+    cipher = utils.KeyCipher('password')
+    enc_keys = cipher.encrypt_many(['x' * 40] * 100)
+    return lambda: cipher.decrypt_many(enc_keys)
+
+
+def bench_verify(hasher):
+    def factory():
+        encoded = hasher.encode('password')
+        assert hasher.verify('password', encoded)
+        return lambda: hasher.verify('password', encoded)
+    return factory
+
+
+BENCHMARKS = [
+    ('authenticate', bench_authenticate),
+    ('authenticate_cached', bench_authenticate_cached),
+    ('get_by_username', bench_get_by_username),
+    ('get_by_username_indexed', bench_get_by_username_indexed),
+    ('create', bench_create),
+    ('encrypt_key', bench_encrypt_key),
+    ('decrypt_key', bench_decrypt_key),
+    ('decrypt_many_100', bench_decrypt_many_100),
+]
+
+# The hashers are called directly, as only those in IAM_PASSWORD_HASHERS
+# are recognized by BCryptPassword. The ones whose library is not
+# installed are skipped.
+for hasher in (hashers.BCryptHasher(), hashers.PBKDF2Hasher(),
+               hashers.SCryptHasher(), hashers.Argon2Hasher()):
+    if hasher.available():
+        BENCHMARKS.append(('verify_' + hasher.algorithm, bench_verify(hasher)))
+
+
+def runbenchmarks(*names):
+    call_command('syncdb', verbosity=0, interactive=False)
+    print '{0:<28} {1:>10} {2:>10} {3:>10} {4:>10}'.format(
+        'benchmark', 'ops/sec', 'p50 ms', 'p99 ms', 'objects/op')
+    for name, factory in BENCHMARKS:
+        if names and name not in names:
+            continue
+        setup()
+        times, allocated = measure(factory(), options.iterations)
+        report(name, times, allocated)
+
+
+if __name__ == '__main__':
+    runbenchmarks(*args)
@@ -11,11 +11,19 @@ if not settings.configured:
     settings.configure(
         DATABASE_ENGINE='sqlite3',
         INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
             'django_auth_iam',
         ],
         AUTHENTICATION_BACKENDS = (
             'django_auth_iam.backends.AmazonIAMBackend',
-        )
+        ),
+        IAM_BCRYPT_ROUNDS=4,
+        IAM_PERMISSION_CACHE_TTL=3600,
+        IAM_CREDENTIAL_CACHE='django_auth_iam.cache.LocalCredentialCache',
+        # Set IAM_CONNECTION_FACTORY=boto to run the tests against AWS.
+        IAM_CONNECTION_FACTORY=os.environ.get('IAM_CONNECTION_FACTORY',
+                                              'django_auth_iam.fake'),
     )
 
 from django.test.simple import run_tests
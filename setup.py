@@ -20,7 +20,8 @@ setup(
     author='Michael Budde',
     author_email='mb@viewworld.dk',
     license='GPL v3',
-    packages=['django_auth_iam'],
+    packages=['django_auth_iam', 'django_auth_iam.management',
+              'django_auth_iam.management.commands'],
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Framework :: Django',